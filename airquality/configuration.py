@@ -17,9 +17,20 @@ from logging.handlers import WatchedFileHandler
 
 CONFIG_FILENAME = os.environ.get("CONFIG_FILENAME", "config.json")
 
+
+def load_configuration(filename=CONFIG_FILENAME):
+    """
+    Reads and parses the configuration file
+
+    :raises OSError: if the file can't be read
+    :raises ValueError: if it isn't valid JSON
+    """
+    with open(filename, "r", encoding="utf-8") as config_fh:
+        return json.loads(config_fh.read())
+
+
 try:
-    with open(CONFIG_FILENAME, "r", encoding="utf-8") as config_fh:
-        config_dict = json.loads(config_fh.read())
+    config_dict = load_configuration()
 except Exception as e:
     print(f"Can't read config file '{CONFIG_FILENAME}' ({e.__class__.__name__}): {e}")
     sys.exit(1)
@@ -34,10 +45,44 @@ VERSION = os.environ.get('APP_VERSION', '0.0.0')
 METRICS = config_dict.get('metrics', {})
 
 METRICS_LISTEN_ADDRESS = METRICS.get('listen_address', "0.0.0.0")
-METRICS_LISTEN_PORT = METRICS.get('listen_port', 19001)
+METRICS_LISTEN_PORT = int(os.environ.get("METRICS_LISTEN_PORT", METRICS.get('listen_port', 19001)))
 
 SOURCES = config_dict.get('sources', [])
 
+ENGINE = config_dict.get('engine', "threads")
+
+STATE = config_dict.get('state', {})
+
+STATE_FILENAME = os.environ.get("STATE_FILENAME", STATE.get('filename'))
+STATE_SAVE_INTERVAL = STATE.get('save_interval', 60)
+
+REPLICAS = config_dict.get('replicas', {})
+
+REPLICA_INDEX = int(os.environ.get("REPLICA_INDEX", REPLICAS.get('index', 0)))
+REPLICA_COUNT = int(os.environ.get("REPLICA_COUNT", REPLICAS.get('count', 1)))
+
+RELOAD = config_dict.get('reload', {})
+
+RELOAD_WATCH_INTERVAL = RELOAD.get('watch_interval', 0)
+
+SHUTDOWN = config_dict.get('shutdown', {})
+
+SHUTDOWN_TIMEOUT = SHUTDOWN.get('timeout', 25)
+
+HISTORY = config_dict.get('history', {})
+
+HISTORY_LISTEN_ADDRESS = HISTORY.get('listen_address', METRICS_LISTEN_ADDRESS)
+HISTORY_LISTEN_PORT = int(os.environ.get("HISTORY_LISTEN_PORT", HISTORY.get('listen_port', 0)))
+
+WORKERS = config_dict.get('workers', {})
+
+WORKERS_PROCESSES = WORKERS.get('processes', 0)
+WORKERS_METRICS_FORWARD_INTERVAL = WORKERS.get('metrics_forward_interval', 1)
+WORKERS_SHUTDOWN_TIMEOUT = WORKERS.get('shutdown_timeout', SHUTDOWN_TIMEOUT)
+
+if WORKERS_PROCESSES == "auto":
+    WORKERS_PROCESSES = os.cpu_count() or 1
+
 logging.root.handlers = []
 logging.basicConfig(
     level=LOG_LEVEL,
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  Adapter engines
+
+  "threads": every source is a thread (provider module's Adapter)
+  "asyncio": all sources are tasks on one event loop (provider module's AsyncAdapter)
+
+"""
+
+import threading
+import functools
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+ENGINES = {
+    "threads": "Adapter",
+    "asyncio": "AsyncAdapter",
+}
+
+
+def get_adapter_class(provider_module, engine):
+    """
+    :raises ValueError: if the engine doesn't exist or the provider doesn't support it
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', known engines: {', '.join(ENGINES)}")
+
+    try:
+        return getattr(provider_module, ENGINES[engine])
+
+    except (AttributeError, ImportError) as e:
+        raise ValueError(f"Provider '{provider_module.__name__}' doesn't support the '{engine}' engine ({e.__class__.__name__}): {e}")
+
+
+class AsyncEngine(threading.Thread):
+    """
+    Runs asyncio adapters on one event loop in a thread of its own
+    """
+
+    def __init__(self, adapters):
+        super().__init__(name="AsyncEngine")
+        self.adapters = adapters
+
+        self.loop = None
+        self.main_task = None
+        self.tasks = {}
+        self.ready = threading.Event()
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except asyncio.CancelledError:
+            pass
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self.main_task = asyncio.current_task()
+
+        for adapter_name, adapter in self.adapters.items():
+            self._start_adapter(adapter_name, adapter)
+
+        self.ready.set()
+
+        try:
+            await self.loop.create_future()
+
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def _start_adapter(self, adapter_name, adapter):
+        task = self.loop.create_task(adapter.run(), name=adapter_name)
+        task.add_done_callback(functools.partial(self._adapter_done, adapter_name))
+        self.tasks[adapter_name] = task
+
+    def _adapter_done(self, adapter_name, task):
+        if self.tasks.get(adapter_name) is task:
+            del self.tasks[adapter_name]
+
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Source '{adapter_name}' failed ({task.exception().__class__.__name__}): {task.exception()}")
+
+    def add(self, adapter_name, adapter):
+        self.ready.wait()
+        self.loop.call_soon_threadsafe(self._start_adapter, adapter_name, adapter)
+
+    def remove(self, adapter_name):
+        self.ready.wait()
+        task = self.tasks.get(adapter_name)
+
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def stop(self, timeout=30):
+        """
+        :return: True if the event loop finished within the timeout
+        """
+        deadline = time.monotonic() + timeout
+
+        for adapter in self.adapters.values():
+            adapter.stop()
+
+        if self.ready.wait(timeout=timeout):
+            self.loop.call_soon_threadsafe(self.main_task.cancel)
+
+        self.join(timeout=max(0.0, deadline - time.monotonic()))
+        return not self.is_alive()
+
+
+class SourceRunner():
+    """
+    Starts and stops the adapters of the sources with the chosen engine
+    """
+
+    def __init__(self, adapters, engine="threads"):
+        self.adapters = adapters
+        self.engine = engine
+        self.async_engine = None
+        self.removed_adapters = []
+
+    def start(self):
+        if self.engine == "asyncio":
+            self.async_engine = AsyncEngine(self.adapters)
+            self.async_engine.start()
+            return
+
+        for adapter in self.adapters.values():
+            adapter.start()
+
+    def add(self, adapter_name, adapter):
+        """
+        Starts an adapter of a source added while running
+        """
+        self.adapters[adapter_name] = adapter
+
+        if self.async_engine is not None:
+            self.async_engine.add(adapter_name, adapter)
+        else:
+            adapter.start()
+
+    def remove(self, adapter_name, release=False):
+        """
+        Stops the adapter of a source removed while running. A thread is joined by stop(),
+        unless it finished by then.
+
+        :param release: the source is removed for good, the adapter releases what it leaves behind once stopped
+        :return: the stopped adapter
+        """
+        adapter = self.adapters.pop(adapter_name)
+        adapter.release_on_stop = release
+        adapter.stop()
+
+        if self.async_engine is not None:
+            self.async_engine.remove(adapter_name)
+        else:
+            self.removed_adapters = [removed_adapter for removed_adapter in self.removed_adapters if removed_adapter.is_alive()]
+            self.removed_adapters.append(adapter)
+
+        return adapter
+
+    def stop(self, timeout=30):
+        """
+        Stops every adapter and waits for them at most timeout seconds in total
+
+        :return: True if all of them stopped in time
+        """
+        if self.async_engine is not None:
+            return self.async_engine.stop(timeout=timeout)
+
+        deadline = time.monotonic() + timeout
+
+        for adapter in self.adapters.values():
+            adapter.stop()
+
+        adapters = list(self.adapters.values()) + self.removed_adapters
+
+        for adapter in adapters:
+            if adapter.is_alive():
+                adapter.join(timeout=max(0.0, deadline - time.monotonic()))
+
+            if adapter.is_alive():
+                logger.error(f"Source '{adapter.name}' didn't stop within {timeout} sec")
+
+        return not any(adapter.is_alive() for adapter in adapters)
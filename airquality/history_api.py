@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,invalid-name
+"""
+
+  History endpoint
+
+  Serves the history of the readings of the targets next to the metrics:
+  GET /history lists the targets, GET /history?country=..&state=..&city=..[&since=..][&until=..][&format=csv]
+  returns the readings of a target within a time range (unix seconds), as JSON or CSV.
+
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import threading
+import logging
+import json
+import csv
+import io
+
+from providers.iqair.history import get_history_store, FIELDS
+
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the history queries
+    """
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path != "/history":
+            self._send_json(404, {"error": True, "message": f"Unknown path {url.path}, try /history"})
+            return
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        try:
+            since = int(query["since"]) if "since" in query else None
+            until = int(query["until"]) if "until" in query else None
+
+        except ValueError:
+            self._send_json(400, {"error": True, "message": "\"since\" and \"until\" must be unix timestamps in seconds"})
+            return
+
+        history_store = get_history_store()
+
+        if "city" not in query:
+            targets = [
+                {"country": country, "state": state, "city": city, "readings": readings_count}
+                for (country, state, city), readings_count in sorted(history_store.targets().items())
+            ]
+            self._send_json(200, {"targets": targets})
+            return
+
+        target_key = (query.get("country"), query.get("state"), query.get("city"))
+        readings = history_store.query(target_key, since=since, until=until)
+
+        if readings is None:
+            self._send_json(404, {"error": True, "message": f"No history of country={target_key[0]}, state={target_key[1]}, city={target_key[2]}"})
+            return
+
+        if query.get("format", "json") == "csv":
+            self._send_csv(readings)
+        else:
+            self._send_json(200, {
+                "country": target_key[0],
+                "state": target_key[1],
+                "city": target_key[2],
+                "readings": [dict(zip(FIELDS, reading)) for reading in readings],
+            })
+
+    def _send(self, status_code, content_type, body):
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status_code, response):
+        self._send(status_code, "application/json", json.dumps(response).encode("utf-8"))
+
+    def _send_csv(self, readings):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(FIELDS)
+        writer.writerows(readings)
+        self._send(200, "text/csv; charset=utf-8", output.getvalue().encode("utf-8"))
+
+
+def serve_history(listen_address, listen_port):
+    """
+    Starts the history server in a daemon thread
+
+    :return: the server, None if it can't listen
+    """
+    try:
+        server = ThreadingHTTPServer((listen_address, listen_port), HistoryRequestHandler)
+
+    except OSError as e:
+        logger.error(f"Can't serve the history on {listen_address} port {listen_port} ({e.__class__.__name__}): {e}")
+        return None
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="HistoryServer", daemon=True).start()
+
+    logger.info(f"Serving the history on {listen_address} port {listen_port}")
+    return server
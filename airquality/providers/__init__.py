@@ -8,12 +8,60 @@
 
 """
 
+import threading
+import importlib
+import logging
 import pkgutil
-import importlib.util
 
-providers = {}
+from .exceptions import UnknownProviderException
 
-for item in pkgutil.iter_modules(["providers",]):
-    _loader = pkgutil.find_loader(f"providers.{item.name}")
-    if _loader:
-        providers[item.name] = _loader.load_module()
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderRegistry():
+    """
+    Discovers provider packages without importing them,
+    a provider is imported the first time it's requested
+    """
+
+    def __init__(self, package_name, package_path):
+        self.package_name = package_name
+        self.package_path = package_path
+
+        self.lock = threading.Lock()
+        self.provider_names = None
+        self.modules = {}
+
+    def names(self):
+        if self.provider_names is None:
+            self.provider_names = sorted(item.name for item in pkgutil.iter_modules(self.package_path) if item.ispkg)
+
+        return self.provider_names
+
+    def __contains__(self, provider_name):
+        return provider_name in self.names()
+
+    def get(self, provider_name):
+        """
+        Returns the provider module, importing it on first use
+
+        :raises UnknownProviderException: if there's no such provider
+        """
+        if provider_name not in self:
+            raise UnknownProviderException(provider_name, self.names())
+
+        with self.lock:
+            if provider_name not in self.modules:
+                logger.debug(f"Loading provider '{provider_name}'")
+                self.modules[provider_name] = importlib.import_module(f"{self.package_name}.{provider_name}")
+
+            return self.modules[provider_name]
+
+
+providers = ProviderRegistry(__name__, __path__)
+
+__all__ = [
+    'providers',
+    'UnknownProviderException',
+]
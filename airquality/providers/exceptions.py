@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,unnecessary-pass
+"""
+
+  Providers
+  Exceptions
+
+"""
+
+
+class UnknownProviderException(Exception):
+    """
+    Raised when a source refers to a provider which doesn't exist
+    """
+    def __init__(self, provider_name, known_providers):
+        self.provider_name = provider_name
+        self.known_providers = known_providers
+
+    def __str__(self):
+        return f"Unknown provider '{self.provider_name}', known providers: {', '.join(self.known_providers)}"
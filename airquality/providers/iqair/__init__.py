@@ -10,6 +10,16 @@
 
 from .adapter import Adapter
 
+
+def __getattr__(name):
+    # The asyncio engine needs aiohttp, it's imported only when that engine is used
+    if name == "AsyncAdapter":
+        from .async_adapter import AsyncAdapter  # pylint: disable=import-outside-toplevel
+        return AsyncAdapter
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     'Adapter',
 ]
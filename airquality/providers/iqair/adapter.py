@@ -9,335 +9,205 @@
 """
 
 import threading
+import functools
 import logging
-import datetime
 import time
-from urllib.parse import urljoin
-
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
 from pyp8s import MetricsHandler
-from .exceptions import (
-    UsageLimitsHitException,
-    APIResponseFailedException,
+from .base import AdapterBase
+from .exceptions import APIResponseFailedException, ServerErrorException
+from .session import (
+    build_session,
+    get_pool_stats,
+    pop_connect_time,
 )
+from .scheduler import Scheduler
+from .retry import retry
+from .coalescer import get_single_flight
+from .quota import KeyRedactingFilter
 
 
 logger = logging.getLogger(__name__)
+logger.addFilter(KeyRedactingFilter())
 
 
-def retry(attempts=10, delay=None):
-
-    def decorate(func):
-        def wrap(*args, **kwargs):
-
-            current_attempt = 0
-
-            while True:
-                current_attempt += 1
-                logger.debug(f"Retry #{current_attempt} for function: {func}")
-
-                try:
-                    result = func(*args, **kwargs)
-                    return result
-
-                except Exception as e:
-                    logger.error(f"Retry #{current_attempt} for function: {func} failed: {e}")
-
-                    if attempts is not None:
-                        if current_attempt >= attempts:
-                            raise e
-
-                    if delay is not None:
-                        time.sleep(delay)
-
-        return wrap
-
-    return decorate
-
-
-class Adapter(threading.Thread):
+class Adapter(AdapterBase, threading.Thread):
     """
     Data provider thread class
     """
 
     def __init__(self, adapter_config, thread_name=None):
-        super().__init__()
-
-        self.api_key = None
-        self.api_base_url = None
-        self.api_version = None
-        self.api_query_limit_minute = None
-        self.api_query_limit_day = None
-        self.api_query_limit_month = None
-
-        self.targets = None
-        self.target_polling_interval = None
-        self.target_polling_backoff_threshold = 120
+        super().__init__(adapter_config, thread_name=thread_name)
 
         self.daemon = False
-        self.alive = True
-
-        self._parse_configuration(**adapter_config)
-        self._initialise_metrics()
-
-        self.api_query_usage = {
-            "total_requests": 0,
-            "minute": {
-                "threshold": self.api_query_limit_minute,
-                "timestamp": datetime.datetime.now(),
-            },
-            "day": {
-                "threshold": self.api_query_limit_day,
-                "timestamp": datetime.datetime.now(),
-            },
-            "month": {
-                "threshold": self.api_query_limit_month,
-                "timestamp": datetime.datetime.now(),
-            },
-        }
-
-        if thread_name is None:
-            self.name = "IQAirAdapter"
-        else:
-            self.name = thread_name
-
-    def _check_limit_minute(self):
-        logger.debug(f"Minute usage limit validation started")
-        now = datetime.datetime.now().replace(microsecond=0)
-
-        minute_count_reached = self.api_query_usage['total_requests'] >= self.api_query_usage["minute"]["threshold"]
-        logger.debug(f"Minute usage limit reached by request count: {minute_count_reached}")
-
-        minute_time_last = self.api_query_usage["minute"]["timestamp"].replace(microsecond=0, second=0)
-        minute_time_now = now.replace(microsecond=0, second=0)
-        minute_time_expired = minute_time_now > minute_time_last
-        logger.debug(f"Minute usage limit expired: {minute_time_expired}")
-
-        if minute_count_reached and not minute_time_expired:
-            logger.warning(f"IQAir API request limit reached per minute: {self.api_query_usage['total_requests']} vs {self.api_query_usage['minute']['threshold']}")
-
-            next_minute = (minute_time_last + datetime.timedelta(minutes=1)).replace(microsecond=0)
-            logger.debug(f"Now: {now}")
-            logger.debug(f"Last usage timestamp: {self.api_query_usage['minute']['timestamp']}")
-            logger.debug(f"Next minute calculated: {next_minute}")
-            logger.debug(f"Delta calculated: {(next_minute - now)}")
-
-            backoff_seconds = (next_minute - now).seconds
-            logger.warning(f"IQAir API request backoff: {backoff_seconds} sec.")
-
-            return {"ok": False, "backoff": backoff_seconds}
-
-        elif not minute_count_reached and not minute_time_expired:
-            logger.debug(f"IQAir API request limit per minute not reached: {self.api_query_usage['total_requests']} vs {self.api_query_usage['minute']['threshold']}")
-            return {"ok": True}
-
-        elif minute_time_expired:
-            logger.debug(f"IQAir API request limits per minute expired: resetting the threshold, and the timestamp")
-            self.api_query_usage["minute"]["threshold"] = self.api_query_usage["total_requests"] + self.api_query_limit_minute
-            self.api_query_usage["minute"]["timestamp"] = datetime.datetime.now()
-            return {"ok": True}
-
-    def _check_limit_day(self):
-        logger.debug(f"Day usage limit validation started")
-        now = datetime.datetime.now()
-
-        day_count_reached = self.api_query_usage['total_requests'] >= self.api_query_usage["day"]["threshold"]
-        logger.debug(f"Day usage limit reached by request count: {day_count_reached}")
-
-        day_time_last = self.api_query_usage["day"]["timestamp"].date()
-        day_time_now = now.date()
-        day_time_expired = day_time_now > day_time_last
-        logger.debug(f"Day usage limit expired: {day_time_expired}")
-
-        if day_count_reached and not day_time_expired:
-            logger.warning(f"IQAir API request limit reached per day: {self.api_query_usage['total_requests']} vs {self.api_query_usage['day']['threshold']}")
-
-            next_day = day_time_last + datetime.timedelta(days=1)
-            logger.debug(f"Now: {now}")
-            logger.debug(f"Last usage timestamp: {self.api_query_usage['day']['timestamp']}")
-            logger.debug(f"Next day calculated: {next_day}")
-            logger.debug(f"Delta calculated: {(next_day - now)}")
-
-            backoff_seconds = (next_day - now).seconds
-            logger.warning(f"IQAir API request backoff: {backoff_seconds} sec.")
-
-            return {"ok": False, "backoff": backoff_seconds}
-
-        elif not day_count_reached and not day_time_expired:
-            logger.debug(f"IQAir API request limit per day not reached: {self.api_query_usage['total_requests']} vs {self.api_query_usage['day']['threshold']}")
-            return {"ok": True}
-
-        elif day_time_expired:
-            logger.debug(f"IQAir API request limits per day expired: resetting the threshold, and the timestamp")
-            self.api_query_usage["day"]["threshold"] = self.api_query_usage["total_requests"] + self.api_query_limit_day
-            self.api_query_usage["day"]["timestamp"] = datetime.datetime.now()
-            return {"ok": True}
-
-    def _check_limits(self):
-        logger.debug(f"Checking IQAir API usage limits")
-
-        day_limit = self._check_limit_day()
-
-        if not day_limit['ok']:
-            logger.warning(f"IQAir API usage hit the daily limits, backoff time {day_limit['backoff']} sec")
-            raise UsageLimitsHitException(f"IQAir API usage hit the daily limits", day_limit['backoff'])
-
-        minute_limit = self._check_limit_minute()
-
-        if not minute_limit['ok']:
-            logger.warning(f"IQAir API usage hit the minute limits, backoff time {minute_limit['backoff']} sec")
-            raise UsageLimitsHitException(f"IQAir API usage hit the minute limits", minute_limit['backoff'])
-
-        logger.debug(f"IQAir API usage limits are OK")
-        return True
-
-    def _parse_configuration(self, api_key, *args,
-                             api_base_url="https://api.airvisual.com/", api_version="v2",
-                             api_query_limit_minute=5, api_query_limit_day=500, api_query_limit_month=10000,
-                             targets=None, target_polling_interval=60*60,
-                             **kwargs):
-        self.api_key = api_key
-        self.api_base_url = api_base_url
-        self.api_version = api_version
-        self.api_query_limit_minute = api_query_limit_minute
-        self.api_query_limit_day = api_query_limit_day
-        self.api_query_limit_month = api_query_limit_month
-
-        self.target_polling_interval = target_polling_interval
 
-        if targets is not None:
-            self.targets = targets
-        else:
-            self.targets = []
+        self.session = build_session(pool_size=self.http_pool_size, retries=self.http_retries)
+        self.scheduler = Scheduler()
+        self.single_flight = get_single_flight()
 
-        if args:
-            logger.warning(f"Ignored configuration parameters: {args}")
+    def _wait_for_quota(self):
+        """
+        Blocks until a key of the pool grants a request slot.
+        Gives up (returns None) if the wait is longer than the backoff threshold.
 
-        if kwargs:
-            logger.warning(f"Ignored configuration parameters: {kwargs}")
-
-    def _initialise_metrics(self):
-        MetricsHandler.init("airquality_iqair_target_results", "counter", "IQAir Adapter plugin, target fetching results")
-        MetricsHandler.init("airquality_iqair_usage_requests_total", "counter", "IQAir Adapter plugin, total API requests")
-        MetricsHandler.init("airquality_iqair_backoff_time_total", "counter", "IQAir Adapter plugin, total backoff time")
-        MetricsHandler.init("airquality_iqair_errors", "counter", "IQAir Adapter plugin errors")
-
-    def _extract_time_from_ts(self, ts):
-        try:
-            weather_update_time_str = ts.split(".")[0]
-            weather_update_time = datetime.datetime.fromisoformat(weather_update_time_str)
-            return int(weather_update_time.timestamp())
-
-        except Exception as e:
-            logger.error(f"Couldn't extract time from {ts} ({e.__class__.__name__}): {e}")
-            logger.warning(f"Falling back to local time as update timestamp")
-            return int(time.time())
+        :return: quota of the granted key
+        """
+        while self.alive:
+            wait_seconds, key_quota = self._quota_wait()
 
-    def _update_metrics(self, data, labels):
-        pollution = data["current"]["pollution"]
-        weather = data["current"]["weather"]
+            if key_quota is not None:
+                return key_quota
 
-        MetricsHandler.set("airquality_aqius",          pollution["aqius"], **labels)
-        MetricsHandler.set("airquality_aqicn",          pollution["aqicn"], **labels)
-        MetricsHandler.set("airquality_temperature",    weather["tp"],      **labels)
-        MetricsHandler.set("airquality_pressure_hpa",   weather["pr"],      **labels)
-        MetricsHandler.set("airquality_humidity",       weather["hu"],      **labels)
-        MetricsHandler.set("airquality_wind_speed",     weather["ws"],      **labels)
-        MetricsHandler.set("airquality_wind_direction", weather["wd"],      **labels)
+            if wait_seconds is None:
+                return None
 
-        weather_update_time = self._extract_time_from_ts(weather['ts'])
-        MetricsHandler.set("airquality_last_update", weather_update_time, subject="weather", **labels)
+            self.pause(wait_seconds)
 
-        pollution_update_time = self._extract_time_from_ts(pollution['ts'])
-        MetricsHandler.set("airquality_last_update", pollution_update_time, subject="pollution", **labels)
+        return None
 
-        return True
+    def _update_pool_metrics(self):
+        pool_stats = get_pool_stats(self.session)
+        MetricsHandler.set("airquality_iqair_http_connections_opened", pool_stats["opened"], source=self.name)
+        MetricsHandler.set("airquality_iqair_http_connections_reused", pool_stats["reused"], source=self.name)
 
-    @retry(attempts=10)
     def _retrieve_data(self, country, state, city):
+        data, shared = self.single_flight.do(
+            self._coalesce_key(country, state, city),
+            functools.partial(self._fetch_data, country, state, city),
+            window=self.coalesce_window,
+            owner=self.name,
+            stop_event=self.stop_event,
+        )
+        return self._process_payload(country, state, city, data, shared=shared)
+
+    @retry
+    def _fetch_data(self, country, state, city):
+        """
+        :return: data of the target, False if the fetch was given up
+        """
         try:
-            self._check_limits()
+            self._check_circuit()
 
-            versioned_url = urljoin(f"{self.api_base_url}/", f"/{self.api_version}/")
-            logger.debug(f"IQAir API versioned URL: {versioned_url}")
+            started_at = time.perf_counter()
+            key_quota = self._wait_for_quota()
+            self._observe_phase("limiter_wait", time.perf_counter() - started_at)
 
-            url = urljoin(versioned_url, "city")
-            logger.debug(f"IQAir API URL: {url}")
+            if key_quota is None:
+                return False
 
             params = {
                 "city": city,
                 "state": state,
                 "country": country,
-                "key": self.api_key,
+                "key": key_quota.api_key,
             }
-            logger.debug(f"IQAir API request parameters: {params}")
 
-            headers = {}
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"IQAir API request parameters: {self._redact_params(params, key_quota)}")
 
-            response = requests.request("GET", url, headers=headers, params=params)
-            logger.debug(f"IQAir API response: status_code={response.status_code}")
-            logger.debug(f"IQAir API response: text={response.text}")
+            pop_connect_time()
+            started_at = time.perf_counter()
 
-            self.api_query_usage['total_requests'] += 1
-            MetricsHandler.inc("airquality_iqair_usage_requests_total", 1)
-            logger.debug(f"IQAir API usage incremented total requests counter: {self.api_query_usage['total_requests']}")
+            try:
+                response = self.session.get(self.api_url_city, params=params, timeout=self.http_timeout)
+            except Exception:
+                self.circuit.record_failure()
+                raise
 
-            if response.status_code == 429:
-                logger.error(f"IQAir API returned 429 Too many requests, total_requests={self.api_query_usage['total_requests']}, threshold={self.api_query_usage['minute']['threshold']}")
-                raise UsageLimitsHitException(f"IQAir API returned 429 Too many requests", 60)
+            request_seconds = time.perf_counter() - started_at
+            self._record_status(response.status_code)
 
-            elif response.status_code == 200:
+            connect_seconds = pop_connect_time()
+            if connect_seconds:
+                self._observe_phase("connect", connect_seconds)
+            self._observe_phase("server_response", max(0.0, request_seconds - connect_seconds))
 
-                response_json = response.json()
-                logger.debug(f"IQAir API response: json={response_json}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"IQAir API response: status_code={response.status_code} text={response.text}")
 
-                if response_json['status'] != 'success':
-                    raise APIResponseFailedException(f"IQAir API didn't return with a success: {response_json}")
+            MetricsHandler.inc("airquality_iqair_usage_requests_total", 1, key=key_quota.key_id)
+            self._update_pool_metrics()
 
-                labels = {
-                    "provider": "IQAir",
-                    "city": city,
-                    "state": state,
-                    "country": country,
-                }
+            if response.status_code == 429:
+                raise self._rate_limited(key_quota)
 
-                metrics_update_result = self._update_metrics(data=response_json['data'], labels=labels)
-                return metrics_update_result
+            if response.status_code in (401, 403):
+                raise self._key_rejected(key_quota, response.status_code)
 
-            else:
+            if response.status_code >= 500:
+                raise ServerErrorException(f"IQAir API server error: status_code={response.status_code} text={response.text}")
+
+            if response.status_code != 200:
                 raise APIResponseFailedException(f"IQAir API request failed: status_code={response.status_code} text={response.text}")
 
-        except UsageLimitsHitException as e:
-            logger.error(f"Interrupting polling cycle for country={country}, state={state}, city={city} because of the IQAir API usage limits")
-            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="limit")
+            started_at = time.perf_counter()
+            data = self._decode_payload(response.content)
+            self._observe_phase("json_decode", time.perf_counter() - started_at)
+
+            return data
+
+        except Exception as e:
+            return self._handle_retrieve_error(e, country, state, city)
+
+    def _poll_target(self, target):
+        if not self._should_poll(target):
+            return None
+
+        retrieve_data_result = self._retrieve_data(*self._target_key(target))
+        self._record_target_result(target, retrieve_data_result)
+        return retrieve_data_result
+
+    def _schedule_targets(self):
+        for target, due_at in self._initial_due_times():
+            self.scheduler.schedule(target, due_at)
 
-            if e.backoff_seconds:
-                if e.backoff_seconds < self.target_polling_backoff_threshold:
-                    logger.warning(f"Waiting for the backoff time of {e.backoff_seconds} sec to pass before retrying")
-                    time.sleep(e.backoff_seconds)
-                    MetricsHandler.inc("airquality_iqair_backoff_time_total", e.backoff_seconds)
-            raise e
+    def _schedule_new_targets(self, due_times):
+        if not self.is_alive():
+            return
 
-        except APIResponseFailedException as e:
-            logger.error(f"Interrupting polling cycle for country={country}, state={state}, city={city} because of an API interaction error: {e}")
-            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="api_error")
-            return False
+        for target, due_at in due_times:
+            self.scheduler.schedule(target, due_at)
 
+    def _reschedule_target(self, target, slots, future):
+        slots.release()
+
+        try:
+            result = future.result()
         except Exception as e:
-            logger.exception(f"Couldn't retrieve data for country={country}, state={state}, city={city} from IQAir API {e.__class__.__name__}: {e}")
-            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="unhandled")
-            raise e
+            logger.error(f"Polling target {target} failed ({e.__class__.__name__}): {e}")
+            result = False
+
+        due_at = self._next_due(target, result)
+
+        if due_at is not None:
+            self.scheduler.schedule(target, due_at)
 
     def run(self):
-        while self.alive:
-            for target in self.targets:
-                retrieve_data_result = self._retrieve_data(**target)
-                MetricsHandler.inc("airquality_iqair_target_results", 1, outcome=retrieve_data_result, **target)
+        self._schedule_targets()
+        slots = threading.BoundedSemaphore(self.max_concurrency)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=self.name) as executor:
+                while self.alive:
+                    target = self.scheduler.get()
+
+                    if target is None:
+                        break
+
+                    if not self._owns(target):
+                        continue
+
+                    slots.acquire()
+                    future = executor.submit(self._poll_target, target)
+                    future.add_done_callback(functools.partial(self._reschedule_target, target, slots))
 
-            logger.debug(f"Sleeping for {self.target_polling_interval} sec until the next polling cycle")
-            time.sleep(self.target_polling_interval)
+        finally:
+            if self.release_on_stop:
+                self.release()
 
     def stop(self):
-        logger.warning(f"Stoppting the thread: {self.name}")
-        self.alive = False
+        logger.warning(f"Stopping the thread: {self.name}")
+        self.stop_event.set()
+        self.scheduler.close()
+        self.session.close()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  asyncio engine: every target is a task on one event loop, waits are cancellable
+
+"""
+
+import functools
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from pyp8s import MetricsHandler
+from .base import AdapterBase
+from .exceptions import APIResponseFailedException, ServerErrorException
+from .retry import async_retry
+from .coalescer import get_async_single_flight
+from .quota import KeyRedactingFilter
+
+
+logger = logging.getLogger(__name__)
+logger.addFilter(KeyRedactingFilter())
+
+
+class AsyncAdapter(AdapterBase):
+    """
+    Data provider running on an asyncio event loop, await run() to poll the targets
+    """
+
+    def __init__(self, adapter_config, thread_name=None, retry_backoff_factor=0.5):
+        super().__init__(adapter_config, thread_name=thread_name)
+
+        self.retry_backoff_factor = retry_backoff_factor
+
+        self.loop = None
+        self.slots = None
+        self.tasks = set()
+        self.tasks_changed = None
+
+        self.session = None
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+        self.single_flight = get_async_single_flight()
+
+    def _build_session(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.http_pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=self.http_timeout[0], sock_read=self.http_timeout[1]),
+            headers={"Connection": "keep-alive"},
+            trace_configs=[trace_config],
+        )
+
+    async def _on_connection_create_start(self, session, context, params):  # pylint: disable=unused-argument
+        context.trace_request_ctx["connect_started_at"] = time.perf_counter()
+
+    async def _on_connection_create_end(self, session, context, params):  # pylint: disable=unused-argument
+        context.trace_request_ctx["connect_seconds"] += time.perf_counter() - context.trace_request_ctx["connect_started_at"]
+        self.connections_opened += 1
+
+    async def _on_connection_reuseconn(self, session, context, params):  # pylint: disable=unused-argument
+        self.connections_reused += 1
+
+    def _update_pool_metrics(self):
+        MetricsHandler.set("airquality_iqair_http_connections_opened", self.connections_opened, source=self.name)
+        MetricsHandler.set("airquality_iqair_http_connections_reused", self.connections_reused, source=self.name)
+
+    async def _wait_for_quota(self):
+        """
+        Waits until a key of the pool grants a request slot.
+        Gives up (returns None) if the wait is longer than the backoff threshold.
+
+        :return: quota of the granted key
+        """
+        while self.alive:
+            wait_seconds, key_quota = self._quota_wait()
+
+            if key_quota is not None:
+                return key_quota
+
+            if wait_seconds is None:
+                return None
+
+            await asyncio.sleep(wait_seconds)
+
+        return None
+
+    async def _request(self, params, trace_request_ctx):
+        """
+        Sends the request, retrying connections which couldn't be opened like the threaded adapter's transport does.
+        Timeouts and 5xx responses are left to the retry policy.
+
+        :return: (status code, body bytes)
+        """
+        current_attempt = 0
+
+        while True:
+            try:
+                async with self.session.get(self.api_url_city, params=params, trace_request_ctx=trace_request_ctx) as response:
+                    return response.status, await response.read()
+
+            except aiohttp.ClientConnectorError:
+                if current_attempt >= self.http_retries:
+                    raise
+
+            await asyncio.sleep(self.retry_backoff_factor * 2 ** current_attempt)
+            current_attempt += 1
+
+    async def _retrieve_data(self, country, state, city):
+        data, shared = await self.single_flight.do(
+            self._coalesce_key(country, state, city),
+            functools.partial(self._fetch_data, country, state, city),
+            window=self.coalesce_window,
+            owner=self.name,
+        )
+        return self._process_payload(country, state, city, data, shared=shared)
+
+    @async_retry
+    async def _fetch_data(self, country, state, city):
+        """
+        :return: data of the target, False if the fetch was given up
+        """
+        try:
+            self._check_circuit()
+
+            started_at = time.perf_counter()
+            key_quota = await self._wait_for_quota()
+            self._observe_phase("limiter_wait", time.perf_counter() - started_at)
+
+            if key_quota is None:
+                return False
+
+            params = {
+                "city": city,
+                "state": state,
+                "country": country,
+                "key": key_quota.api_key,
+            }
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"IQAir API request parameters: {self._redact_params(params, key_quota)}")
+
+            trace_request_ctx = {"connect_seconds": 0.0}
+            started_at = time.perf_counter()
+
+            try:
+                status_code, body = await self._request(params, trace_request_ctx)
+            except Exception:
+                self.circuit.record_failure()
+                raise
+
+            request_seconds = time.perf_counter() - started_at
+            self._record_status(status_code)
+
+            connect_seconds = trace_request_ctx["connect_seconds"]
+            if connect_seconds:
+                self._observe_phase("connect", connect_seconds)
+            self._observe_phase("server_response", max(0.0, request_seconds - connect_seconds))
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"IQAir API response: status_code={status_code} text={body}")
+
+            MetricsHandler.inc("airquality_iqair_usage_requests_total", 1, key=key_quota.key_id)
+            self._update_pool_metrics()
+
+            if status_code == 429:
+                raise self._rate_limited(key_quota)
+
+            if status_code in (401, 403):
+                raise self._key_rejected(key_quota, status_code)
+
+            if status_code >= 500:
+                raise ServerErrorException(f"IQAir API server error: status_code={status_code} text={body}")
+
+            if status_code != 200:
+                raise APIResponseFailedException(f"IQAir API request failed: status_code={status_code} text={body}")
+
+            started_at = time.perf_counter()
+            data = self._decode_payload(body)
+            self._observe_phase("json_decode", time.perf_counter() - started_at)
+
+            return data
+
+        except Exception as e:
+            return self._handle_retrieve_error(e, country, state, city)
+
+    async def _poll_target(self, target):
+        if not self._should_poll(target):
+            return None
+
+        retrieve_data_result = await self._retrieve_data(*self._target_key(target))
+        self._record_target_result(target, retrieve_data_result)
+        return retrieve_data_result
+
+    async def _run_target(self, target, due_at):
+        while self.alive and due_at is not None:
+            await asyncio.sleep(max(0.0, due_at - time.time()))
+
+            if not self._owns(target):
+                break
+
+            async with self.slots:
+                try:
+                    result = await self._poll_target(target)
+                except asyncio.CancelledError:
+                    if not self.alive:
+                        raise
+                    logger.error(f"Polling target {target} was cancelled while the adapter is running, polling it again when it's due")
+                    result = False
+                except Exception as e:
+                    logger.error(f"Polling target {target} failed ({e.__class__.__name__}): {e}")
+                    result = False
+
+            due_at = self._next_due(target, result)
+
+    def _spawn_targets(self, due_times):
+        for target, due_at in due_times:
+            task = self.loop.create_task(self._run_target(target, due_at))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        self.tasks_changed.set()
+
+    def _schedule_new_targets(self, due_times):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._spawn_targets, due_times)
+
+    async def run(self):
+        """
+        Polls the targets until stopped or cancelled
+        """
+        self.loop = asyncio.get_running_loop()
+        self.session = self._build_session()
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.tasks_changed = asyncio.Event()
+
+        try:
+            self._spawn_targets(self._initial_due_times())
+
+            while self.alive:
+                self.tasks_changed.clear()
+
+                if self.tasks:
+                    await asyncio.wait(set(self.tasks))
+                else:
+                    await self.tasks_changed.wait()
+
+        finally:
+            try:
+                self._cancel_tasks()
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+                await self.session.close()
+
+            finally:
+                # The engine cancels a removed source on top of stop(), the cleanup above can be interrupted
+                if self.release_on_stop:
+                    self.release()
+
+    def _cancel_tasks(self):
+        for task in self.tasks:
+            task.cancel()
+
+        self.tasks_changed.set()
+
+    def stop(self):
+        """
+        Stops polling: waiting and polling targets are cancelled, run() returns
+        """
+        logger.warning(f"Stopping the adapter: {self.name}")
+        self.stop_event.set()
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._cancel_tasks)
@@ -0,0 +1,904 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,too-many-instance-attributes,too-many-statements
+"""
+
+  IQAir API Adapter
+  Engine-independent part: configuration, targets, metrics, scheduling decisions and state
+
+"""
+
+import functools
+import threading
+import inspect
+import logging
+import datetime
+import json
+import random
+import time
+from urllib.parse import urljoin
+
+from pyp8s import MetricsHandler
+from .exceptions import (
+    UsageLimitsHitException,
+    KeyRejectedException,
+    APIResponseFailedException,
+    ServerErrorException,
+    CircuitOpenException,
+)
+from .retry import RetryPolicy
+from .circuit import get_circuit
+from .histogram import get_histogram
+from .keypool import KeyPool
+from .series import get_series_registry, remove_series, TargetSeries
+from .quota import KeyRedactingFilter
+from .history import get_history_store
+from .cache import FreshnessCache
+from .planner import BudgetPlanner
+from .coalescer import IN_FLIGHT
+from ..sharding import select_shard
+
+
+logger = logging.getLogger(__name__)
+logger.addFilter(KeyRedactingFilter())
+
+POLLUTION_FIELDS = ("ts", "aqius", "aqicn")
+WEATHER_FIELDS = ("ts", "tp", "pr", "hu", "ws", "wd")
+
+CYCLE_OVERRUN_TOLERANCE = 1.1
+
+RELOADABLE_OPTIONS = (
+    "targets",
+    "target_polling_interval",
+    "target_polling_jitter",
+    "target_retry_interval",
+    "budget_recompute_interval",
+    "retry_attempts",
+    "retry_backoff_base",
+    "retry_backoff_max",
+    "coalesce_window",
+    "series_ttl_factor",
+    "series_limit",
+    "history_size",
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_ts(ts):
+    """
+    Parses an API timestamp ("2025-02-07T07:00:00.000Z") into unix seconds, as UTC unless it has another offset.
+    Memoized: a timestamp is shared by the readings of many targets and repeats until the upstream updates.
+    """
+    parsed = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+
+    return int(parsed.timestamp())
+
+
+class AdapterBase():
+    """
+    Logic shared by the threaded and the asyncio adapters
+    """
+
+    def __init__(self, adapter_config, thread_name=None):
+        super().__init__()
+
+        if thread_name is None:
+            self.name = "IQAirAdapter"
+        else:
+            self.name = thread_name
+
+        self.api_keys = None
+        self.api_key_rest_interval = None
+        self.api_base_url = None
+        self.api_version = None
+        self.api_url_city = None
+        self.api_query_limit_minute = None
+        self.api_query_limit_day = None
+        self.api_query_limit_month = None
+
+        self.replica_index = None
+        self.replica_count = None
+        self.shard_index = None
+        self.shard_count = None
+
+        self.adapter_config = dict(adapter_config)
+
+        self.targets = None
+        self.target_keys = None
+        self.target_polling_interval = None
+        self.target_polling_jitter = None
+        self.target_retry_interval = None
+        self.target_polling_backoff_threshold = 120
+
+        self.budget_recompute_interval = None
+
+        self.max_concurrency = None
+
+        self.http_pool_size = None
+        self.http_timeout = None
+        self.http_retries = None
+
+        self.retry_policy = None
+        self.circuit_failure_threshold = None
+        self.circuit_reset_timeout = None
+
+        self.cache = None
+        self.cache_enabled = None
+
+        self.coalesce_window = None
+
+        self.series = get_series_registry()
+        self.series_ttl_factor = None
+        self.series_limit = None
+
+        self.history = get_history_store()
+        self.history_size = None
+        self.target_series = {}
+
+        self.stop_event = threading.Event()
+        self.release_on_stop = False
+
+        self._parse_configuration(**adapter_config)
+        self.target_keys = frozenset(self._target_key(target) for target in self.targets)
+        self._initialise_metrics()
+
+        self.circuit = get_circuit(
+            self.api_url_city,
+            failure_threshold=self.circuit_failure_threshold,
+            reset_timeout=self.circuit_reset_timeout,
+        )
+
+        self.target_due = {}
+        self.cycle = None
+        self.cycle_lock = threading.Lock()
+
+        self.key_pool = KeyPool(self.api_keys, owner=self.name)
+
+        self.planner = BudgetPlanner(
+            self.name,
+            self.key_pool,
+            self.targets,
+            recompute_interval=self.budget_recompute_interval,
+        )
+
+    def release(self):
+        """
+        Drops what a source removed for good leaves behind: its limits and share of the API keys,
+        the series labelled with its name, and the series of the targets no other source polls.
+        Called by the engine once the adapter stopped, so no poll in flight recreates them.
+        """
+        self.key_pool.release()
+        self.series.forget_source(self.name)
+
+        def should_remove(labels):
+            return labels.get("source") == self.name
+
+        for metric in list(MetricsHandler.get_metrics().values()):
+            remove_series(metric, should_remove)
+
+        self.phase_histogram.remove(should_remove)
+        self.cycle_histogram.remove(should_remove)
+
+        logger.info(f"Released the quota share and the series of '{self.name}'")
+
+    @property
+    def alive(self):
+        return not self.stop_event.is_set()
+
+    def pause(self, seconds):
+        """
+        Sleeps unless the adapter is stopped in the meantime
+
+        :return: False if the adapter was stopped
+        """
+        return not self.stop_event.wait(timeout=seconds)
+
+    def _parse_configuration(self, api_key=None, *args,  # pylint: disable=keyword-arg-before-vararg
+                             api_keys=None, api_key_rest_interval=60*60,
+                             api_base_url="https://api.airvisual.com/", api_version="v2",
+                             api_query_limit_minute=5, api_query_limit_day=500, api_query_limit_month=10000,
+                             targets=None, target_polling_interval=60*60, target_polling_jitter=0.5, target_retry_interval=5*60,
+                             budget_recompute_interval=10*60,
+                             max_concurrency=1,
+                             replica_index=0, replica_count=1, shard_index=0, shard_count=1, quota_divisor=1,
+                             http_pool_size=None, http_timeout_connect=5, http_timeout_read=30, http_retries=3,
+                             retry_attempts=5, retry_backoff_base=1, retry_backoff_max=30,
+                             circuit_failure_threshold=5, circuit_reset_timeout=60,
+                             cache_enabled=True, cache_update_interval=60*60, cache_grace_period=5*60, cache_recheck_interval=10*60,
+                             coalesce_window=30,
+                             series_ttl_factor=3, series_limit=None,
+                             history_size=48,
+                             **kwargs):
+        self.api_base_url = api_base_url
+        self.api_version = api_version
+
+        versioned_url = urljoin(f"{self.api_base_url}/", f"/{self.api_version}/")
+        self.api_url_city = urljoin(versioned_url, "city")
+        logger.debug(f"IQAir API URL: {self.api_url_city}")
+
+        self.replica_count = max(1, int(replica_count))
+        self.replica_index = int(replica_index) % self.replica_count
+        self.shard_count = max(1, int(shard_count))
+        self.shard_index = int(shard_index) % self.shard_count
+
+        quota_divisor = max(1, int(quota_divisor)) * self.replica_count
+        self.api_query_limit_minute = max(1, api_query_limit_minute // quota_divisor)
+        self.api_query_limit_day = max(1, api_query_limit_day // quota_divisor)
+        self.api_query_limit_month = max(1, api_query_limit_month // quota_divisor)
+
+        self.api_keys = self._parse_api_keys(api_key, api_keys, quota_divisor)
+        self.api_key_rest_interval = api_key_rest_interval
+
+        self.target_polling_interval = target_polling_interval
+        self.target_polling_jitter = target_polling_jitter
+        self.target_retry_interval = target_retry_interval
+        self.budget_recompute_interval = budget_recompute_interval
+        self.max_concurrency = max(1, int(max_concurrency))
+
+        if http_pool_size is not None:
+            self.http_pool_size = max(1, int(http_pool_size))
+        else:
+            self.http_pool_size = self.max_concurrency
+
+        self.http_timeout = (http_timeout_connect, http_timeout_read)
+        self.http_retries = http_retries
+
+        self.retry_policy = RetryPolicy(attempts=retry_attempts, base_delay=retry_backoff_base, max_delay=retry_backoff_max)
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_reset_timeout = circuit_reset_timeout
+
+        self.cache_enabled = cache_enabled
+        self.cache = FreshnessCache(
+            update_interval=cache_update_interval,
+            grace_period=cache_grace_period,
+            recheck_interval=cache_recheck_interval,
+        )
+
+        self.coalesce_window = max(0.0, float(coalesce_window))
+        self.series_ttl_factor = series_ttl_factor
+        self.series_limit = series_limit
+        self.history_size = max(0, int(history_size))
+
+        self.targets = self._select_targets(self._parse_targets(targets))
+
+        if args:
+            logger.warning(f"Ignored configuration parameters: {args}")
+
+        if kwargs:
+            logger.warning(f"Ignored configuration parameters: {kwargs}")
+
+    def _parse_api_keys(self, api_key, api_keys, quota_divisor):
+        """
+        Builds the key pool configuration from "api_key" and "api_keys". An entry of "api_keys" is
+        a key, or a dict with "api_key" and its own "api_query_limit_*" (default: the source limits).
+
+        :return: list of (api_key, limit_minute, limit_day, limit_month)
+        :raises ValueError: if no key is configured
+        """
+        result = []
+        entries = ([api_key] if api_key is not None else []) + list(api_keys or [])
+
+        for entry in entries:
+            if not isinstance(entry, dict):
+                result.append((entry, self.api_query_limit_minute, self.api_query_limit_day, self.api_query_limit_month))
+                continue
+
+            if "api_key" not in entry:
+                logger.error(f"Ignored API key entry without 'api_key'")
+                continue
+
+            result.append((
+                entry["api_key"],
+                max(1, entry.get("api_query_limit_minute", self.api_query_limit_minute * quota_divisor) // quota_divisor),
+                max(1, entry.get("api_query_limit_day", self.api_query_limit_day * quota_divisor) // quota_divisor),
+                max(1, entry.get("api_query_limit_month", self.api_query_limit_month * quota_divisor) // quota_divisor),
+            ))
+
+        if not result:
+            raise ValueError(f"Source '{self.name}' has no 'api_key' or 'api_keys' configured")
+
+        return result
+
+    def _parse_targets(self, targets):
+        """
+        Validates the targets and merges duplicates: a target listed more than once
+        is polled once, with the shortest polling interval and the highest weight
+        """
+        result = {}
+
+        for target in targets or []:
+            try:
+                weight = float(target.get("weight", target.get("priority", 1)))
+
+                if weight <= 0:
+                    logger.error(f"Ignored target with a non-positive weight: {target}")
+                    continue
+
+                parsed_target = {
+                    "country": target["country"],
+                    "state": target["state"],
+                    "city": target["city"],
+                    "polling_interval": target.get("polling_interval", self.target_polling_interval),
+                    "weight": weight,
+                }
+
+            except KeyError as e:
+                logger.error(f"Ignored target without {e}: {target}")
+                continue
+
+            except (TypeError, ValueError) as e:
+                logger.error(f"Ignored target with an invalid weight ({e}): {target}")
+                continue
+
+            target_key = self._target_key(parsed_target)
+            duplicate = result.get(target_key)
+
+            if duplicate is None:
+                result[target_key] = parsed_target
+                continue
+
+            logger.warning(f"Merged duplicate target: {target}")
+            duplicate["polling_interval"] = min(duplicate["polling_interval"], parsed_target["polling_interval"])
+            duplicate["weight"] = max(duplicate["weight"], parsed_target["weight"])
+
+        return list(result.values())
+
+    def _select_targets(self, targets):
+        """
+        Keeps the targets owned by this replica, and then by this shard within the replica
+        """
+        def target_hash_key(target):
+            return "|".join(self._target_key(target))
+
+        owned_targets = select_shard(targets, target_hash_key, self.replica_index, self.replica_count, salt="replica")
+        owned_targets = select_shard(owned_targets, target_hash_key, self.shard_index, self.shard_count, salt="shard")
+
+        if len(owned_targets) != len(targets):
+            logger.info(f"Replica {self.replica_index}/{self.replica_count}, shard {self.shard_index}/{self.shard_count} owns {len(owned_targets)} of {len(targets)} targets")
+
+        return owned_targets
+
+    def reconfigure(self, adapter_config):
+        """
+        Applies a new configuration in place, when only the targets and the polling options changed.
+        Targets which are still configured keep their schedule and cached data; new ones are
+        spread across their polling interval.
+
+        :return: True if applied, False if the adapter has to be recreated for the new configuration
+        """
+        changed_options = {
+            option for option in set(self.adapter_config) | set(adapter_config)
+            if self.adapter_config.get(option) != adapter_config.get(option)
+        }
+
+        if not changed_options:
+            return True
+
+        if not changed_options.issubset(RELOADABLE_OPTIONS):
+            logger.info(f"Options {sorted(changed_options.difference(RELOADABLE_OPTIONS))} of '{self.name}' can't be changed in place")
+            return False
+
+        parameters = inspect.signature(self._parse_configuration).parameters
+
+        def option(name):
+            return adapter_config.get(name, parameters[name].default)
+
+        self.target_polling_interval = option("target_polling_interval")
+        self.target_polling_jitter = option("target_polling_jitter")
+        self.target_retry_interval = option("target_retry_interval")
+        self.budget_recompute_interval = option("budget_recompute_interval")
+        self.planner.recompute_interval = self.budget_recompute_interval
+        self.retry_policy = RetryPolicy(attempts=option("retry_attempts"), base_delay=option("retry_backoff_base"), max_delay=option("retry_backoff_max"))
+        self.coalesce_window = max(0.0, float(option("coalesce_window")))
+        self.series_ttl_factor = option("series_ttl_factor")
+        self.series_limit = option("series_limit")
+        self.history_size = max(0, int(option("history_size")))
+
+        self.adapter_config = dict(adapter_config)
+        evicted_keys = self.series.forget_evictions(self.name)
+        self._update_targets(self._select_targets(self._parse_targets(option("targets"))))
+
+        readmitted_targets = [
+            target for target in self.targets
+            if self._target_key(target) in evicted_keys and self._target_key(target) not in self.target_due
+        ]
+
+        if readmitted_targets:
+            logger.info(f"Polling {len(readmitted_targets)} targets of '{self.name}' evicted over the series limit again")
+            self._schedule_new_targets(self._spread_due_times(readmitted_targets, time.time()))
+
+        logger.info(f"Reconfigured '{self.name}': {', '.join(sorted(changed_options))}")
+        return True
+
+    def _update_targets(self, targets):
+        """
+        Replaces the targets, updating the ones which are still configured in place
+        (the engine holds them), and schedules the new ones
+        """
+        current_targets = {self._target_key(target): target for target in self.targets}
+        updated_targets = []
+        added_targets = []
+
+        for target in targets:
+            current_target = current_targets.get(self._target_key(target))
+
+            if current_target is None:
+                added_targets.append(target)
+                updated_targets.append(target)
+            else:
+                current_target.update(target)
+                updated_targets.append(current_target)
+
+        self.planner.set_targets(updated_targets)
+        self.targets = updated_targets
+        self.target_keys = frozenset(self._target_key(target) for target in updated_targets)
+
+        for target_key in set(current_targets).difference(self.target_keys):
+            self.target_due.pop(target_key, None)
+            self.target_series.pop(target_key, None)
+
+        with self.cycle_lock:
+            self._start_cycle(time.time())
+
+        MetricsHandler.set("airquality_iqair_targets_owned", len(self.targets), source=self.name, replica=self.replica_index)
+        logger.info(f"Targets of '{self.name}': {len(added_targets)} added, {len(current_targets) - len(updated_targets) + len(added_targets)} removed, {len(updated_targets)} total")
+
+        if added_targets:
+            self._schedule_new_targets(self._spread_due_times(added_targets, time.time()))
+
+    def _schedule_new_targets(self, due_times):
+        """
+        Hands targets added by reconfigure() to the engine
+
+        :param due_times: list of (target, due time)
+        """
+        raise NotImplementedError
+
+    def _owns(self, target):
+        return self._target_key(target) in self.target_keys
+
+    @staticmethod
+    def _target_key(target):
+        return (target["country"], target["state"], target["city"])
+
+    @staticmethod
+    def _target_location(target):
+        return {
+            "country": target["country"],
+            "state": target["state"],
+            "city": target["city"],
+        }
+
+    def _initialise_metrics(self):
+        MetricsHandler.init("airquality_iqair_target_results", "counter", "IQAir Adapter plugin, target fetching results")
+        MetricsHandler.init("airquality_iqair_usage_requests_total", "counter", "IQAir Adapter plugin, total API requests")
+        MetricsHandler.init("airquality_iqair_backoff_time_total", "counter", "IQAir Adapter plugin, total backoff time")
+        MetricsHandler.init("airquality_iqair_errors", "counter", "IQAir Adapter plugin errors")
+        MetricsHandler.init("airquality_iqair_http_connections_opened", "gauge", "IQAir Adapter plugin, HTTP connections opened")
+        MetricsHandler.init("airquality_iqair_http_connections_reused", "gauge", "IQAir Adapter plugin, HTTP requests served over a reused connection")
+        MetricsHandler.init("airquality_iqair_cache_requests", "counter", "IQAir Adapter plugin, freshness cache results (skip, hit, miss)")
+        MetricsHandler.init("airquality_iqair_budget_rate", "gauge", "IQAir Adapter plugin, available and planned API requests per hour")
+        MetricsHandler.init("airquality_iqair_budget_planned", "gauge", "IQAir Adapter plugin, API requests planned for the current quota window")
+        MetricsHandler.init("airquality_iqair_budget_used", "gauge", "IQAir Adapter plugin, API requests used in the current quota window")
+        MetricsHandler.init("airquality_iqair_target_polling_interval", "gauge", "IQAir Adapter plugin, planned polling interval of a target")
+        MetricsHandler.init("airquality_iqair_cycle_overruns_total", "counter", "IQAir Adapter plugin, polling cycles which took longer than the planned interval")
+        MetricsHandler.init("airquality_iqair_targets_owned", "gauge", "IQAir Adapter plugin, targets polled by this replica")
+        MetricsHandler.init("airquality_iqair_coalesced_requests_total", "counter", "IQAir Adapter plugin, API requests saved by sharing another fetch of the same target")
+        MetricsHandler.init("airquality_iqair_series_active", "gauge", "IQAir Adapter plugin, series carrying the location labels of the targets of a source")
+        MetricsHandler.init("airquality_iqair_series_evicted_total", "counter", "IQAir Adapter plugin, series removed as stale or over the limit of a source")
+
+        MetricsHandler.set("airquality_iqair_targets_owned", len(self.targets), source=self.name, replica=self.replica_index)
+
+        self.phase_histogram = get_histogram("airquality_iqair_request_phase_seconds", "IQAir Adapter plugin, time spent in every phase of an API request")
+        self.cycle_histogram = get_histogram("airquality_iqair_cycle_duration_seconds", "IQAir Adapter plugin, time it took to poll every target once")
+
+    def _observe_phase(self, phase, seconds):
+        self.phase_histogram.observe(seconds, provider="IQAir", source=self.name, phase=phase)
+
+    def _extract_time_from_ts(self, ts):
+        try:
+            return _parse_ts(ts)
+
+        except Exception as e:
+            logger.error(f"Couldn't extract time from {ts} ({e.__class__.__name__}): {e}")
+            logger.warning(f"Falling back to local time as update timestamp")
+            return int(time.time())
+
+    def _target_series(self, country, state, city):
+        """
+        Returns the series of a target, with its labels built once
+        """
+        target_key = (country, state, city)
+        target_series = self.target_series.get(target_key)
+
+        if target_series is None:
+            target_series = self.target_series[target_key] = TargetSeries({
+                "provider": "IQAir",
+                "city": city,
+                "state": state,
+                "country": country,
+            })
+
+        return target_series
+
+    def _update_metrics(self, data, target_key):
+        pollution = data["current"]["pollution"]
+        weather = data["current"]["weather"]
+        target_series = self._target_series(*target_key)
+
+        target_series.set("airquality_aqius",          pollution["aqius"])
+        target_series.set("airquality_aqicn",          pollution["aqicn"])
+        target_series.set("airquality_temperature",    weather["tp"])
+        target_series.set("airquality_pressure_hpa",   weather["pr"])
+        target_series.set("airquality_humidity",       weather["hu"])
+        target_series.set("airquality_wind_speed",     weather["ws"])
+        target_series.set("airquality_wind_direction", weather["wd"])
+
+        weather_update_time = self._extract_time_from_ts(weather['ts'])
+        target_series.set("airquality_last_update", weather_update_time, extra_label=("subject", "weather"))
+
+        pollution_update_time = self._extract_time_from_ts(pollution['ts'])
+        target_series.set("airquality_last_update", pollution_update_time, extra_label=("subject", "pollution"))
+
+        self.history.record(target_key, self.history_size, pollution_update_time, weather_update_time, (
+            pollution["aqius"], pollution["aqicn"], weather["tp"], weather["pr"], weather["hu"], weather["ws"], weather["wd"],
+        ), owner=self.name)
+
+        return True
+
+    def _update_cache(self, country, state, city, data, now=None):
+        pollution_ts = self._extract_time_from_ts(data["current"]["pollution"]["ts"])
+        weather_ts = self._extract_time_from_ts(data["current"]["weather"]["ts"])
+
+        advanced = self.cache.store((country, state, city), data, pollution_ts, weather_ts, now=now)
+
+        if self.cache_enabled:
+            MetricsHandler.inc("airquality_iqair_cache_requests", 1, source=self.name, result="miss" if advanced else "hit")
+
+    def _rate_limited(self, key_quota):
+        """
+        Marks the minute window of the key as used up after a 429 response,
+        the next attempt goes to another key of the pool
+
+        :return: exception to raise
+        """
+        logger.error(f"IQAir API returned 429 Too many requests, key={key_quota.key_id}")
+        key_quota.exhaust("minute")
+        return UsageLimitsHitException(f"IQAir API returned 429 Too many requests", self.key_pool.wait_time())
+
+    def _key_rejected(self, key_quota, status_code):
+        """
+        Rests a key which the API refused (401, 403) for "api_key_rest_interval"
+
+        :return: exception to raise
+        """
+        key_quota.rest(self.api_key_rest_interval, reason=f"status_{status_code}")
+        return KeyRejectedException(f"IQAir API rejected key={key_quota.key_id}: status_code={status_code}", self.key_pool.wait_time())
+
+    def _coalesce_key(self, country, state, city):
+        """
+        Fetches of the same target with the same API key and endpoint are shared
+        """
+        return (self.key_pool.key_id, self.api_url_city, country, state, city)
+
+    def _check_payload(self, response_json):
+        """
+        :return: data of a decoded API response
+        :raises APIResponseFailedException: if the response isn't a success
+        """
+        if response_json['status'] != 'success':
+            raise APIResponseFailedException(f"IQAir API didn't return with a success: {response_json}")
+
+        return response_json['data']
+
+    def _decode_payload(self, body):
+        """
+        Decodes the body of a response and keeps only the fields used by the metrics, the cache and the history
+
+        :return: data of the target
+        :raises APIResponseFailedException: if the response isn't a success or misses a field
+        """
+        data = self._check_payload(json.loads(body))
+
+        try:
+            pollution = data["current"]["pollution"]
+            weather = data["current"]["weather"]
+
+            return {"current": {
+                "pollution": {field: pollution[field] for field in POLLUTION_FIELDS},
+                "weather": {field: weather[field] for field in WEATHER_FIELDS},
+            }}
+
+        except (KeyError, TypeError) as e:
+            raise APIResponseFailedException(f"IQAir API response misses a field ({e.__class__.__name__}): {e}")
+
+    @staticmethod
+    def _redact_params(params, key_quota):
+        """
+        :return: request parameters safe to be logged, with the API key replaced by its identifier
+        """
+        return dict(params, key=f"<key {key_quota.key_id}>")
+
+    def _process_payload(self, country, state, city, data, shared=None):
+        """
+        Updates the metrics and the cache from the data of a fetch, which may have been shared with other callers
+
+        :param shared: how the fetch was shared (coalescer.IN_FLIGHT or coalescer.RECENT), None if this caller made it
+        """
+        if shared is not None:
+            MetricsHandler.inc("airquality_iqair_coalesced_requests_total", 1, source=self.name, mode=shared)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Shared {'an in-flight' if shared == IN_FLIGHT else 'a recent'} fetch of country={country}, state={state}, city={city}")
+
+        if not data:
+            return False
+
+        if self.series.is_evicted(self.name, (country, state, city)):
+            logger.debug(f"Dropped the data of country={country}, state={state}, city={city}, evicted over the series limit")
+            return False
+
+        try:
+            started_at = time.perf_counter()
+            metrics_update_result = self._update_metrics(data=data, target_key=(country, state, city))
+            self._observe_phase("update_metrics", time.perf_counter() - started_at)
+            self._update_cache(country, state, city, data)
+            return metrics_update_result
+
+        except Exception as e:
+            logger.exception(f"Couldn't process data for country={country}, state={state}, city={city} ({e.__class__.__name__}): {e}")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="process_payload", reason="unhandled")
+            return False
+
+    def _check_circuit(self):
+        if not self.circuit.allow():
+            raise CircuitOpenException(f"Circuit breaker of {self.api_url_city} is {self.circuit.state}, retrying in {self.circuit.retry_in():.0f} sec")
+
+    def _record_status(self, status_code):
+        """
+        Reports the outcome of a request to the circuit breaker: only server errors count as failures
+        """
+        if status_code >= 500:
+            self.circuit.record_failure()
+        else:
+            self.circuit.record_success()
+
+    def _handle_retrieve_error(self, error, country, state, city):
+        """
+        Logs and counts a failed retrieval. API errors and an open circuit give up on the target
+        (returns False), server errors and anything else are raised again for the retry decorator.
+        """
+        if isinstance(error, CircuitOpenException):
+            logger.warning(f"Skipping country={country}, state={state}, city={city}: {error}")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="circuit_open")
+            return False
+
+        if isinstance(error, KeyRejectedException):
+            logger.error(f"Retrying country={country}, state={state}, city={city} with another API key: {error}")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="key_rejected")
+            raise error
+
+        if isinstance(error, UsageLimitsHitException):
+            logger.error(f"Interrupting polling cycle for country={country}, state={state}, city={city} because of the IQAir API usage limits: {error}")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="limit")
+            raise error
+
+        if isinstance(error, ServerErrorException):
+            logger.error(f"Retrying country={country}, state={state}, city={city} after a server error: {error}")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="server_error")
+            raise error
+
+        if isinstance(error, APIResponseFailedException):
+            logger.error(f"Interrupting polling cycle for country={country}, state={state}, city={city} because of an API interaction error: {error}")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="api_error")
+            return False
+
+        logger.exception(f"Couldn't retrieve data for country={country}, state={state}, city={city} from IQAir API {error.__class__.__name__}: {error}")
+        MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="unhandled")
+        raise error
+
+    def _quota_wait(self):
+        """
+        Tries to take a request slot from the key pool
+
+        :return: (0, quota of the key) if a slot was granted, (seconds to wait before trying again, None),
+                 or (None, None) to skip the target
+        """
+        wait_seconds, blocking_window, key_quota = self.key_pool.acquire()
+
+        if key_quota is not None:
+            self.planner.record_request()
+            return 0, key_quota
+
+        if wait_seconds >= self.target_polling_backoff_threshold:
+            logger.warning(f"IQAir API usage hit the {blocking_window} limits of every key, next slot in {wait_seconds:.0f} sec, skipping")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="retrieve_data", reason="limit")
+            return None, None
+
+        logger.warning(f"IQAir API usage hit the {blocking_window} limits of every key, waiting {wait_seconds:.1f} sec")
+        MetricsHandler.inc("airquality_iqair_backoff_time_total", wait_seconds)
+        return wait_seconds, None
+
+    def _should_poll(self, target):
+        target_key = self._target_key(target)
+
+        if self.cache_enabled and not self.cache.is_due(target_key):
+            logger.debug(f"Upstream data for {target_key} isn't due yet, skipping")
+            MetricsHandler.inc("airquality_iqair_cache_requests", 1, source=self.name, result="skip")
+            return False
+
+        return True
+
+    def _record_target_result(self, target, retrieve_data_result):
+        MetricsHandler.inc("airquality_iqair_target_results", 1, outcome=retrieve_data_result, **self._target_location(target))
+
+    def _start_cycle(self, now):
+        target_keys = [self._target_key(target) for target in self.targets if not self.series.is_evicted(self.name, self._target_key(target))]
+
+        self.cycle = {
+            "started_at": now,
+            "pending": set(target_keys),
+            "interval": max((self.planner.interval(target_key) for target_key in target_keys), default=self.target_polling_interval),
+        }
+
+    def _complete_cycle_target(self, target_key, now):
+        """
+        Marks a target as polled in the current cycle; once every target is, measures the cycle.
+        A cycle overruns when it takes noticeably longer than the longest planned interval.
+        """
+        self.cycle["pending"].discard(target_key)
+
+        if self.cycle["pending"]:
+            return
+
+        cycle_seconds = now - self.cycle["started_at"]
+        self.cycle_histogram.observe(cycle_seconds, provider="IQAir", source=self.name)
+
+        if cycle_seconds > self.cycle["interval"] * CYCLE_OVERRUN_TOLERANCE:
+            logger.warning(f"Polling cycle of '{self.name}' took {cycle_seconds:.0f} sec, longer than the planned {self.cycle['interval']:.0f} sec")
+            MetricsHandler.inc("airquality_iqair_cycle_overruns_total", 1, provider="IQAir", source=self.name)
+
+        self._start_cycle(now)
+
+    def _initial_due_times(self):
+        """
+        Spreads the first polls of all targets evenly across their polling intervals
+
+        :return: list of (target, due time)
+        """
+        now = time.time()
+        result = self._spread_due_times(self.targets, now)
+
+        logger.debug(f"Scheduled {len(result)} targets")
+        self._start_cycle(now)
+        return result
+
+    def _spread_due_times(self, targets, now):
+        targets_count = len(targets)
+        result = []
+
+        for position, target in enumerate(targets):
+            target_key = self._target_key(target)
+            slot_seconds = self.planner.interval(target_key) / targets_count
+            jitter_seconds = random.uniform(0, slot_seconds * self.target_polling_jitter)
+            due_at = now + position * slot_seconds + jitter_seconds
+
+            self.target_due[target_key] = due_at
+            result.append((target, due_at))
+
+        return result
+
+    def _next_due(self, target, result):
+        """
+        Completes the target in the current cycle and returns when it should be polled next:
+        when the upstream data is due (skipped), after the planned interval (success),
+        or after the retry interval (failure). Returns None for a target removed by reconfigure().
+        Doesn't raise: the engines call it where an error would end the polling of the target,
+        the target is polled again after the retry interval then.
+        """
+        try:
+            return self._plan_next_due(target, result)
+
+        except Exception as e:
+            logger.exception(f"Couldn't schedule the next poll of target {target} ({e.__class__.__name__}): {e}, polling it again in {self.target_retry_interval} sec")
+            MetricsHandler.inc("airquality_iqair_errors", 1, area="schedule", reason="unhandled")
+            return time.time() + self.target_retry_interval
+
+    def _plan_next_due(self, target, result):
+        now = time.time()
+        target_key = self._target_key(target)
+
+        with self.cycle_lock:
+            self._complete_cycle_target(target_key, now)
+
+        if target_key not in self.target_keys:
+            logger.debug(f"Target {target_key} was removed, not scheduling it again")
+            return None
+
+        if self.series.is_evicted(self.name, target_key):
+            logger.debug(f"Target {target_key} was evicted over the series limit, not scheduling it again")
+            self.target_due.pop(target_key, None)
+            return None
+
+        if result is None:
+            due_at = self.cache.next_due(target_key)
+        elif result:
+            due_at = self.target_due[target_key] + self.planner.interval(target_key)
+        else:
+            due_at = now + min(self.planner.interval(target_key), self.target_retry_interval)
+
+        due_at = max(due_at, now)
+        logger.debug(f"Next poll of {target_key} in {due_at - now:.0f} sec")
+
+        self._record_series(target_key, refreshed=result is not False, now=now)
+
+        self.target_due[target_key] = due_at
+        return due_at
+
+    def _record_series(self, target_key, refreshed, now=None):
+        """
+        Keeps the series of a target from expiring: they're removed when the target isn't polled (refreshed)
+        within "series_ttl_factor" planned polling intervals
+        """
+        ttl = self.series_ttl_factor * self.planner.interval(target_key, now=now) if self.series_ttl_factor else 0
+        self.series.record(self.name, target_key, ttl, refreshed, limit=self.series_limit, now=now)
+        self.series.maybe_sweep(now=now)
+
+    def dump_state(self):
+        """
+        Returns the adapter state to be persisted across restarts
+        """
+        targets = []
+
+        for target in self.targets:
+            target_key = self._target_key(target)
+            entry = self.cache.get(target_key)
+
+            if entry is not None:
+                targets.append([*target_key, entry["fetched_at"], entry["data"]])
+
+        return {
+            "quota": {
+                "keys": self.key_pool.dump(),
+            },
+            "budget": self.planner.dump(),
+            "targets": targets,
+        }
+
+    def load_state(self, state):
+        """
+        Restores the usage counters, and the last readings of the targets which are still configured
+        """
+        quota_state = state.get("quota", {})
+
+        if "keys" in quota_state:
+            self.key_pool.restore(quota_state["keys"])
+        elif "key" in quota_state:
+            self.key_pool.restore({quota_state["key"]: quota_state.get("windows", {})})
+
+        self.planner.restore(state.get("budget", {}))
+
+        target_keys = {self._target_key(target) for target in self.targets}
+        restored_count = 0
+
+        for country, state_name, city, fetched_at, data in state.get("targets", []):
+            if (country, state_name, city) not in target_keys:
+                continue
+
+            try:
+                self._update_metrics(data=data, target_key=(country, state_name, city))
+                self.cache.store((country, state_name, city), data,
+                                 self._extract_time_from_ts(data["current"]["pollution"]["ts"]),
+                                 self._extract_time_from_ts(data["current"]["weather"]["ts"]),
+                                 now=fetched_at)
+                self._record_series((country, state_name, city), refreshed=True)
+                restored_count += 1
+
+            except Exception as e:
+                logger.error(f"Couldn't restore the last reading of country={country}, state={state_name}, city={city} ({e.__class__.__name__}): {e}")
+
+        logger.info(f"Restored the state of '{self.name}': {restored_count} targets")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  Freshness-aware response cache
+
+"""
+
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class FreshnessCache():
+    """
+    Keeps the last payload of every target together with its update timestamps,
+    and predicts when the upstream is expected to publish newer data
+    """
+
+    def __init__(self, update_interval=60*60, grace_period=5*60, recheck_interval=10*60):
+        self.update_interval = update_interval
+        self.grace_period = grace_period
+        self.recheck_interval = recheck_interval
+
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def next_due(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        return entry["due_at"]
+
+    def is_due(self, key, now=None):
+        if now is None:
+            now = time.time()
+
+        due_at = self.next_due(key)
+        return due_at is None or now >= due_at
+
+    def store(self, key, data, pollution_ts, weather_ts, now=None):
+        """
+        Saves the payload and computes when the next update is due.
+        If the data hasn't advanced, the target is rechecked after "recheck_interval".
+
+        :return: True if the upstream data advanced since the previous store
+        :rtype: bool
+        """
+        if now is None:
+            now = time.time()
+
+        oldest_ts = min(pollution_ts, weather_ts)
+        predicted_due_at = oldest_ts + self.update_interval + self.grace_period
+        due_at = max(predicted_due_at, now + self.recheck_interval)
+
+        with self.lock:
+            previous = self.entries.get(key)
+            advanced = previous is None or (pollution_ts, weather_ts) != (previous["pollution_ts"], previous["weather_ts"])
+
+            self.entries[key] = {
+                "data": data,
+                "pollution_ts": pollution_ts,
+                "weather_ts": weather_ts,
+                "fetched_at": now,
+                "due_at": due_at,
+            }
+
+        logger.debug(f"Cached data for {key}: advanced={advanced} due_in={due_at - now:.0f} sec")
+        return advanced
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  Circuit breaker
+
+"""
+
+import threading
+import logging
+import time
+
+from pyp8s import MetricsHandler
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_circuits = {}
+_circuits_lock = threading.Lock()
+
+
+class CircuitBreaker():
+    """
+    Stops requests to an endpoint after consecutive failures.
+
+    closed: requests pass, "failure_threshold" failures in a row open the circuit
+    open: requests are refused until "reset_timeout" seconds have passed
+    half_open: one probe request passes; its success closes the circuit, its failure opens it again.
+               A probe which never reports back is replaced after "reset_timeout" seconds.
+    """
+
+    def __init__(self, endpoint, failure_threshold=5, reset_timeout=60):
+        self.endpoint = endpoint
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+
+        self._update_metrics()
+
+    def allow(self, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+
+                self._transition(HALF_OPEN)
+
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                return False
+
+            self.probe_started_at = now
+            return True
+
+    def retry_in(self, now=None):
+        """
+        Returns the seconds left until the circuit lets a probe through
+        """
+        if now is None:
+            now = time.monotonic()
+
+        with self.lock:
+            if self.state == OPEN:
+                return max(0.0, self.opened_at + self.reset_timeout - now)
+
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probe_started_at = None
+
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        with self.lock:
+            self.failures += 1
+            self.probe_started_at = None
+
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = now
+                self._transition(OPEN)
+
+    def _transition(self, state):
+        logger.warning(f"Circuit breaker of {self.endpoint}: {self.state} -> {state} after {self.failures} failures in a row")
+        self.state = state
+        self._update_metrics()
+
+    def _update_metrics(self):
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            MetricsHandler.set("airquality_iqair_circuit_state", int(state == self.state), endpoint=self.endpoint, state=state)
+
+
+def get_circuit(endpoint, failure_threshold=5, reset_timeout=60):
+    """
+    Returns the process-wide circuit breaker of an endpoint, creating it on first use
+    """
+    with _circuits_lock:
+        if not _circuits:
+            MetricsHandler.init("airquality_iqair_circuit_state", "gauge", "IQAir Adapter plugin, circuit breaker state of an API endpoint (1 for the current state)")
+
+        if endpoint not in _circuits:
+            _circuits[endpoint] = CircuitBreaker(endpoint, failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+
+        return _circuits[endpoint]
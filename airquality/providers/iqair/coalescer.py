@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,too-few-public-methods
+"""
+
+  IQAir API Adapter
+  Request coalescing (single flight)
+
+  Concurrent fetches of the same key share one in-flight request. A successful result
+  is also handed to fetches starting within a short window after it finished.
+  A result is reported as shared only to another owner (source) than the one which fetched it.
+
+"""
+
+import collections
+import functools
+import threading
+import asyncio
+import time
+
+
+IN_FLIGHT = "in_flight"
+RECENT = "recent"
+
+# Seconds a thread waits for a flight of another thread before checking whether it's stopped
+WAIT_SLICE = 0.5
+
+
+class Flight():
+    """
+    One fetch and its outcome
+    """
+
+    def __init__(self, owner=None):
+        self.done = threading.Event()
+        self.owner = owner
+        self.future = None
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class FlightTable():
+    """
+    Flights by key; finished successful flights are kept for the longest window asked for
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.finished = collections.deque()
+        self.max_window = 0.0
+
+    def join(self, key, window, now, owner=None):
+        """
+        :return: (flight, how it's shared: IN_FLIGHT, RECENT, or None when the caller leads a new flight)
+        """
+        with self.lock:
+            self.max_window = max(self.max_window, window)
+
+            while self.finished and now - self.finished[0][0] > self.max_window:
+                _, expired_key, expired_flight = self.finished.popleft()
+
+                if self.flights.get(expired_key) is expired_flight:
+                    del self.flights[expired_key]
+
+            flight = self.flights.get(key)
+
+            if flight is not None:
+                if flight.finished_at is None:
+                    return flight, IN_FLIGHT
+
+                if now - flight.finished_at <= window:
+                    return flight, RECENT
+
+            flight = Flight(owner=owner)
+            self.flights[key] = flight
+            return flight, None
+
+    @staticmethod
+    def shared_with(flight, shared, owner):
+        """
+        :return: how a flight was shared with the owner, None if the owner fetched it itself
+        """
+        if owner is not None and flight.owner == owner:
+            return None
+
+        return shared
+
+    def finish(self, key, flight):
+        flight.finished_at = time.monotonic()
+
+        with self.lock:
+            if flight.error is None and flight.result:
+                self.finished.append((flight.finished_at, key, flight))
+            elif self.flights.get(key) is flight:
+                del self.flights[key]
+
+
+class SingleFlight(FlightTable):
+    """
+    Request coalescing for threads
+    """
+
+    def do(self, key, func, window=0.0, owner=None, stop_event=None):
+        """
+        Runs func, unless a flight of the same key is running or has just succeeded
+
+        :param owner: name of the caller's source
+        :param stop_event: stops waiting for the flight of another thread when set, the result is False then
+        :return: (result, how it was shared: IN_FLIGHT, RECENT or None)
+        """
+        flight, shared = self.join(key, window, time.monotonic(), owner=owner)
+
+        if shared is not None:
+            while not flight.done.wait(WAIT_SLICE):
+                if stop_event is not None and stop_event.is_set():
+                    return False, None
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.result, self.shared_with(flight, shared, owner)
+
+        try:
+            flight.result = func()
+            return flight.result, None
+
+        except BaseException as e:
+            flight.error = e
+            raise
+
+        finally:
+            self.finish(key, flight)
+            flight.done.set()
+
+
+class AsyncSingleFlight(FlightTable):
+    """
+    Request coalescing for coroutines running on one event loop.
+    The fetch runs as a task of its own, which belongs to the leader: it's cancelled with the leader
+    (whose adapter is stopping), the callers waiting for it then lead a new flight with their own function.
+    """
+
+    async def do(self, key, coroutine_func, window=0.0, owner=None):
+        """
+        Awaits coroutine_func(), unless a flight of the same key is running or has just succeeded
+
+        :param owner: name of the caller's source
+        :return: (result, how it was shared: IN_FLIGHT, RECENT or None)
+        """
+        while True:
+            flight, shared = self.join(key, window, time.monotonic(), owner=owner)
+
+            if shared is None:
+                flight.future = asyncio.get_running_loop().create_task(coroutine_func())
+                flight.future.add_done_callback(functools.partial(self._land, key, flight))
+
+            try:
+                return await asyncio.shield(flight.future), self.shared_with(flight, shared, owner)
+
+            except asyncio.CancelledError:
+                if not flight.future.cancelled():
+                    if shared is None:
+                        flight.future.cancel()
+                    raise
+
+            # The leader was cancelled while this caller still wants the data: lead a new flight
+
+    def _land(self, key, flight, future):
+        if future.cancelled():
+            flight.error = asyncio.CancelledError()
+        else:
+            flight.error = future.exception()
+            flight.result = None if flight.error is not None else future.result()
+
+        self.finish(key, flight)
+
+
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+
+
+def get_single_flight():
+    return _single_flight
+
+
+def get_async_single_flight():
+    return _async_single_flight
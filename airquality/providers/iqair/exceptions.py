@@ -27,8 +27,29 @@ class UsageLimitsHitException(Exception):
         return " ".join([self.message, self.backoff_suffix, ])
 
 
+class KeyRejectedException(UsageLimitsHitException):
+    """
+    Raised when the API refused an API key (401, 403)
+    """
+    pass
+
+
 class APIResponseFailedException(Exception):
     """
     Raised when API interaction has failed
     """
     pass
+
+
+class ServerErrorException(APIResponseFailedException):
+    """
+    Raised when the API answered with a server error (5xx), worth another attempt
+    """
+    pass
+
+
+class CircuitOpenException(Exception):
+    """
+    Raised when the circuit breaker of an API endpoint doesn't let requests through
+    """
+    pass
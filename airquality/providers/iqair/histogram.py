@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  Histogram metrics
+
+"""
+
+import threading
+import bisect
+
+from pyp8s import MetricsHandler
+from pyp8s.metrics import Metric
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def _format_labels(labels):
+    return [f'{label_name}="{label_value}"' for label_name, label_value in labels]
+
+
+class HistogramSeries(Metric):
+    """
+    pyp8s metric rendering one series of a histogram (_bucket, _sum or _count) at scrape time
+    """
+
+    def __init__(self, metric_name, histogram, series):
+        super().__init__(metric_name=metric_name)
+        self.histogram = histogram
+        self.series = series
+
+    def get_labelsets(self):
+        return self.histogram.render(self.series)
+
+
+class Histogram():
+    """
+    Prometheus-style histogram: <name>_bucket (with the "le" label), <name>_sum and <name>_count.
+    Observations only update in-memory counts, the series are built when metrics are scraped.
+    """
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+
+        self.lock = threading.Lock()
+        self.data = {}
+
+        for series, suffix in (("bucket", "cumulative buckets"), ("sum", "sum"), ("count", "count")):
+            metric = HistogramSeries(f"{name}_{series}", self, series)
+            metric.set_help(f"{description} ({suffix})")
+            metric.set_type("counter")
+            MetricsHandler.get_metrics()[f"{name}_{series}"] = metric
+
+    def observe(self, value, **labels):
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        labelset = tuple(labels.items())
+
+        with self.lock:
+            item = self.data.get(labelset)
+
+            if item is None:
+                item = self.data[labelset] = {"buckets": [0] * len(self.bucket_labels), "sum": 0.0, "count": 0}
+
+            item["buckets"][bucket_index] += 1
+            item["sum"] += value
+            item["count"] += 1
+
+    def remove(self, should_remove):
+        """
+        Drops the labelsets matching should_remove(labels)
+        """
+        with self.lock:
+            for labelset in [labelset for labelset in self.data if should_remove(dict(labelset))]:
+                del self.data[labelset]
+
+    def render(self, series):
+        with self.lock:
+            snapshot = [(labelset, list(item["buckets"]), item["sum"], item["count"]) for labelset, item in self.data.items()]
+
+        result = {}
+
+        for labelset, buckets, value_sum, value_count in snapshot:
+            labelset_key = "_".join(f"{label_name}_{label_value}" for label_name, label_value in labelset)
+
+            if series == "sum":
+                result[labelset_key] = {"value": value_sum, "labels_formatted": _format_labels(labelset)}
+
+            elif series == "count":
+                result[labelset_key] = {"value": value_count, "labels_formatted": _format_labels(labelset)}
+
+            else:
+                cumulative = 0
+
+                for bucket_label, bucket_count in zip(self.bucket_labels, buckets):
+                    cumulative += bucket_count
+                    result[f"{labelset_key}_le_{bucket_label}"] = {"value": cumulative, "labels_formatted": _format_labels(labelset + (("le", bucket_label),))}
+
+        return result
+
+
+def get_histogram(name, description, buckets=DEFAULT_BUCKETS):
+    """
+    Returns the process-wide histogram with the given name, creating it on first use
+    """
+    with _histograms_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, description, buckets=buckets)
+
+        return _histograms[name]
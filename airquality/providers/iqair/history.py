@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  History of the readings
+
+  Every target keeps its last readings in a ring buffer of preallocated array columns:
+  4 bytes per field and reading, so the memory of a target is fixed by the history size.
+  Sources sharing a target share its buffer, sized for the longest history any of them keeps.
+
+"""
+
+import threading
+import logging
+import array
+import math
+
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FIELDS = ("pollution_ts", "weather_ts")
+VALUE_FIELDS = ("aqius", "aqicn", "tp", "pr", "hu", "ws", "wd")
+FIELDS = TIMESTAMP_FIELDS + VALUE_FIELDS
+
+
+class HistoryBuffer():
+    """
+    Ring buffer of the last readings of a target, one array per field.
+    Timestamps are unsigned 32-bit seconds, values 32-bit floats (NaN when missing).
+    """
+
+    __slots__ = ("capacity", "columns", "position", "count")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = [array.array("I", bytes(4 * capacity)) for _ in TIMESTAMP_FIELDS]
+        self.columns.extend(array.array("f", bytes(4 * capacity)) for _ in VALUE_FIELDS)
+        self.position = 0
+        self.count = 0
+
+    def last(self):
+        """
+        :return: the latest reading, None if the buffer is empty
+        """
+        if not self.count:
+            return None
+
+        index = (self.position - 1) % self.capacity
+        return tuple(column[index] for column in self.columns)
+
+    def append(self, reading):
+        """
+        Appends a reading (a tuple of FIELDS), overwriting the oldest one when the buffer is full
+        """
+        for column, value in zip(self.columns, reading):
+            column[self.position] = value
+
+        self.position = (self.position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def readings(self, since=None, until=None):
+        """
+        Yields the readings, oldest first, whose latest timestamp is within [since, until]
+        """
+        start = (self.position - self.count) % self.capacity
+
+        for offset in range(self.count):
+            index = (start + offset) % self.capacity
+            reading_ts = max(self.columns[0][index], self.columns[1][index])
+
+            if (since is None or reading_ts >= since) and (until is None or reading_ts <= until):
+                yield tuple(column[index] for column in self.columns)
+
+    def resize(self, capacity):
+        """
+        :return: a buffer of another capacity with the latest readings of this one
+        """
+        resized = HistoryBuffer(capacity)
+
+        for reading in list(self.readings())[-capacity:]:
+            resized.append(reading)
+
+        return resized
+
+
+def _value(value):
+    if value is None:
+        return math.nan
+
+    try:
+        return float(value)
+
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class HistoryStore():
+    """
+    History buffers of the targets of every source in the process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.capacities = {}
+        self.pending = None
+
+    def record(self, target_key, capacity, pollution_ts, weather_ts, values, owner=None):
+        """
+        Records a reading of a target, unless neither timestamp advanced since the previous one
+        (the same data polled again, or shared by another source)
+
+        :param capacity: readings the owner keeps for the target, 0 to keep none
+        :param values: sequence of the VALUE_FIELDS, missing values are stored as NaN
+        :param owner: name of the recording source
+        :return: True if the reading was recorded
+        """
+        if capacity <= 0:
+            with self.lock:
+                self.capacities.get(target_key, {}).pop(owner, None)
+
+            return False
+
+        reading = (pollution_ts, weather_ts) + tuple(_value(value) for value in values)
+        return self.append(target_key, capacity, reading, owner=owner)
+
+    def append(self, target_key, capacity, reading, owner=None):
+        """
+        :param capacity: readings the owner keeps for the target; the buffer keeps the most any owner asked for
+        """
+        with self.lock:
+            owner_capacities = self.capacities.setdefault(target_key, {})
+            owner_capacities[owner] = capacity
+            capacity = max(owner_capacities.values())
+            history_buffer = self.buffers.get(target_key)
+
+            if history_buffer is None:
+                history_buffer = self.buffers[target_key] = HistoryBuffer(capacity)
+
+            elif history_buffer.capacity != capacity:
+                history_buffer = self.buffers[target_key] = history_buffer.resize(capacity)
+
+            last_reading = history_buffer.last()
+
+            if last_reading is not None and reading[0] <= last_reading[0] and reading[1] <= last_reading[1]:
+                return False
+
+            history_buffer.append(reading)
+
+            if self.pending is not None:
+                self.pending.append((target_key, capacity, reading))
+
+            return True
+
+    def track(self):
+        """
+        Starts collecting the recorded readings for collect()
+        """
+        with self.lock:
+            if self.pending is None:
+                self.pending = []
+
+    def collect(self):
+        """
+        :return: list of (target_key, capacity, reading) recorded since the previous call
+        """
+        with self.lock:
+            if self.pending is None:
+                return []
+
+            pending, self.pending = self.pending, []
+            return pending
+
+    def discard(self, target_keys):
+        with self.lock:
+            for target_key in target_keys:
+                self.buffers.pop(target_key, None)
+                self.capacities.pop(target_key, None)
+
+    def targets(self):
+        """
+        :return: target key -> number of readings kept
+        """
+        with self.lock:
+            return {target_key: history_buffer.count for target_key, history_buffer in self.buffers.items()}
+
+    def query(self, target_key, since=None, until=None):
+        """
+        :return: list of readings (tuples of FIELDS, NaN values replaced with None), None for an unknown target
+        """
+        with self.lock:
+            history_buffer = self.buffers.get(target_key)
+
+            if history_buffer is None:
+                return None
+
+            readings = list(history_buffer.readings(since=since, until=until))
+
+        return [
+            reading[:len(TIMESTAMP_FIELDS)] + tuple(None if math.isnan(value) else round(value, 2) for value in reading[len(TIMESTAMP_FIELDS):])
+            for reading in readings
+        ]
+
+
+_store = HistoryStore()
+
+
+def get_history_store():
+    return _store
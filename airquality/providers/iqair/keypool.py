@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  API key pool of a source
+
+"""
+
+import logging
+import time
+
+from .quota import (
+    get_key_id,
+    get_quota,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class KeyPool():
+    """
+    Quotas of the API keys of a source. Every request goes to the key with the
+    largest remaining fraction of its tightest window, resting keys are left out.
+    The quotas are process-wide, so a key rested by one source is rested for all of them.
+    """
+
+    def __init__(self, keys, owner=None):
+        """
+        :param keys: list of (api_key, limit_minute, limit_day, limit_month)
+        :param owner: name of the source using the keys
+        """
+        self.owner = owner
+        self.quotas = [
+            get_quota(api_key, limit_minute=limit_minute, limit_day=limit_day, limit_month=limit_month, owner=owner)
+            for api_key, limit_minute, limit_day, limit_month in keys
+        ]
+
+        if len(self.quotas) == 1:
+            self.key_id = self.quotas[0].key_id
+        else:
+            self.key_id = get_key_id("|".join(sorted(quota.key_id for quota in self.quotas)))
+
+    def acquire(self, now=None):
+        """
+        Reserves a request slot from the key with the most quota left
+
+        :return: (0.0, None, quota of the key) if a slot was reserved,
+                 otherwise the shortest wait time, the name of its blocking window and None
+        :rtype: tuple
+        """
+        if now is None:
+            now = time.time()
+
+        wait_seconds = None
+        blocking_window = None
+
+        for quota in sorted(self.quotas, key=lambda quota: quota.headroom(now), reverse=True):
+            key_wait_seconds, key_blocking_window = quota.acquire(now)
+
+            if key_blocking_window is None:
+                return 0.0, None, quota
+
+            if wait_seconds is None or key_wait_seconds < wait_seconds:
+                wait_seconds = key_wait_seconds
+                blocking_window = key_blocking_window
+
+        return wait_seconds, blocking_window, None
+
+    def wait_time(self, now=None):
+        return min(quota.wait_time(now) for quota in self.quotas)
+
+    def set_share(self, owner, weight):
+        for quota in self.quotas:
+            quota.set_share(owner, weight)
+
+    def release(self):
+        """
+        Forgets the limits and the share of the source in its keys, once it's removed
+        """
+        for quota in self.quotas:
+            quota.release(self.owner)
+
+    def get_share(self, owner):
+        """
+        Returns the share of the owner across the keys, weighted by their day limits
+        """
+        total_limit = 0
+        share = 0.0
+
+        for quota in self.quotas:
+            day_limit = quota.windows["day"].limit
+            total_limit += day_limit
+            share += quota.get_share(owner) * day_limit
+
+        return share / max(1, total_limit)
+
+    def snapshot(self, now=None):
+        """
+        Returns the limit, usage and reset time of every window, summed over the keys which aren't resting
+        """
+        if now is None:
+            now = time.time()
+
+        result = {}
+
+        for quota in self.quotas:
+            quota_snapshot = quota.snapshot(now)
+
+            for window_name, window in quota_snapshot.items():
+                total = result.setdefault(window_name, {"limit": 0, "count": 0, "reset_at": window["reset_at"]})
+
+                if now >= quota.resting_until:
+                    total["limit"] += window["limit"]
+                    total["count"] += window["count"]
+
+        return result
+
+    def dump(self):
+        return {quota.key_id: quota.dump() for quota in self.quotas}
+
+    def restore(self, saved, now=None):
+        for quota in self.quotas:
+            if quota.key_id in saved:
+                quota.restore(saved[quota.key_id], now=now)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  Quota budget planner
+
+"""
+
+import threading
+import logging
+import time
+
+from pyp8s import MetricsHandler
+from .quota import (
+    create_windows,
+    dump_windows,
+    restore_windows,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_rates(budget, demands):
+    """
+    Splits a budget (requests per second) across targets proportionally to their weights,
+    never giving a target more than it asks for. Whatever a capped target doesn't use
+    is redistributed among the others.
+
+    :param budget: Total requests per second available
+    :type budget: float
+    :param demands: Target key -> (weight, maximum requests per second)
+    :type demands: dict
+
+    :return: Target key -> allocated requests per second
+    :rtype: dict
+    """
+    rates = {}
+    pending = dict(demands)
+
+    while pending and budget > 0:
+        total_weight = sum(weight for weight, _ in pending.values())
+        capped = {key: rate_max for key, (weight, rate_max) in pending.items() if budget * weight / total_weight >= rate_max}
+
+        if not capped:
+            for key, (weight, _) in pending.items():
+                rates[key] = budget * weight / total_weight
+            return rates
+
+        for key, rate_max in capped.items():
+            rates[key] = rate_max
+            budget -= rate_max
+            del pending[key]
+
+    for key in pending:
+        rates[key] = 0.0
+
+    return rates
+
+
+class BudgetPlanner():
+    """
+    Computes polling intervals of the targets so that the quota
+    lasts until the end of every window (minute, day, month)
+    """
+
+    def __init__(self, owner, quota, targets, recompute_interval=10*60):
+        self.owner = owner
+        self.quota = quota
+        self.recompute_interval = recompute_interval
+
+        self.lock = threading.Lock()
+        self.targets = {}
+        self.intervals = {}
+        self.computed_at = 0
+
+        self.usage = create_windows()
+
+        self.set_targets(targets)
+
+    def set_targets(self, targets):
+        with self.lock:
+            self.targets = {(target["country"], target["state"], target["city"]): target for target in targets}
+            self.computed_at = 0
+
+        self.quota.set_share(self.owner, sum(target["weight"] for target in targets))
+
+    def record_request(self, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            for window in self.usage.values():
+                window.roll(now)
+                window.count += 1
+                MetricsHandler.set("airquality_iqair_budget_used", window.count, source=self.owner, window=window.name)
+
+    def dump(self):
+        with self.lock:
+            return dump_windows(self.usage)
+
+    def restore(self, saved, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            restore_windows(self.usage, saved, now)
+            self.computed_at = 0
+
+    def interval(self, target_key, now=None):
+        """
+        Returns the planned polling interval of a target, recomputing the plan when it's outdated
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            if now - self.computed_at >= self.recompute_interval:
+                self._compute(now)
+
+            return self.intervals.get(target_key, self.targets[target_key]["polling_interval"])
+
+    def _compute(self, now):
+        share = self.quota.get_share(self.owner)
+        budget = None
+        budget_reset_at = now
+
+        for window_name, window in self.quota.snapshot(now).items():
+            seconds_left = max(1.0, window["reset_at"] - now)
+
+            if window_name == "minute":
+                window_budget = window["limit"] / 60
+            else:
+                window_budget = max(0, window["limit"] - window["count"]) / seconds_left
+
+            if budget is None or window_budget < budget:
+                budget = window_budget
+                budget_reset_at = window["reset_at"]
+
+        budget *= share
+
+        demands = {
+            target_key: (target["weight"], 1 / max(0.001, target["polling_interval"]))
+            for target_key, target in self.targets.items()
+        }
+        rates = allocate_rates(budget, demands)
+
+        self.intervals = {}
+
+        for target_key, target in self.targets.items():
+            rate = rates.get(target_key, 0.0)
+
+            if rate > 0:
+                self.intervals[target_key] = max(target["polling_interval"], 1 / rate)
+            else:
+                # Nothing left for the target until the window limiting the budget resets
+                self.intervals[target_key] = max(target["polling_interval"], budget_reset_at - now)
+
+        self.computed_at = now
+        self._update_metrics(now, budget, sum(rates.values()))
+
+        logger.debug(f"Quota budget of '{self.owner}': {budget * 3600:.1f} requests/hour, planned {sum(rates.values()) * 3600:.1f} requests/hour for {len(self.targets)} targets")
+
+    def _update_metrics(self, now, budget, planned_rate):
+        MetricsHandler.set("airquality_iqair_budget_rate", budget * 3600, source=self.owner, subject="available")
+        MetricsHandler.set("airquality_iqair_budget_rate", planned_rate * 3600, source=self.owner, subject="planned")
+
+        for window_name, window in self.usage.items():
+            window.roll(now)
+            planned = window.count + planned_rate * max(0, window.reset_at - now)
+
+            MetricsHandler.set("airquality_iqair_budget_planned", round(planned), source=self.owner, window=window_name)
+            MetricsHandler.set("airquality_iqair_budget_used", window.count, source=self.owner, window=window_name)
+
+        for target_key, interval in self.intervals.items():
+            country, state, city = target_key
+            MetricsHandler.set("airquality_iqair_target_polling_interval", round(interval), source=self.owner, country=country, state=state, city=city)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,too-few-public-methods
+"""
+
+  IQAir API Adapter
+  Usage quota engine
+
+"""
+
+import threading
+import hashlib
+import logging
+import time
+
+from pyp8s import MetricsHandler
+
+
+logger = logging.getLogger(__name__)
+
+_quotas = {}
+_quotas_lock = threading.Lock()
+
+
+def get_key_id(api_key):
+    """
+    Returns a short, non-reversible identifier of an API key,
+    safe to be used in logs and metric labels
+    """
+    return hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:12]
+
+
+def _next_minute(now):
+    return (int(now) // 60 + 1) * 60
+
+
+def _next_day(now):
+    local_now = time.localtime(now)
+    return time.mktime((local_now.tm_year, local_now.tm_mon, local_now.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+def _next_month(now):
+    local_now = time.localtime(now)
+    return time.mktime((local_now.tm_year, local_now.tm_mon + 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+class QuotaWindow():
+    """
+    Request counter for a calendar-aligned window (minute, day, month).
+    The reset time is computed once per window, so checks are O(1).
+    """
+
+    def __init__(self, name, limit, next_reset):
+        self.name = name
+        self.limit = limit
+        self.next_reset = next_reset
+
+        self.count = 0
+        self.reset_at = 0
+
+    def roll(self, now):
+        if now >= self.reset_at:
+            self.count = 0
+            self.reset_at = self.next_reset(now)
+
+    def remaining(self):
+        return max(0, self.limit - self.count)
+
+    def wait_time(self, now):
+        if self.count < self.limit:
+            return 0.0
+
+        return max(0.0, self.reset_at - now)
+
+
+def create_windows(limit_minute=None, limit_day=None, limit_month=None):
+    return {
+        "minute": QuotaWindow("minute", limit_minute, _next_minute),
+        "day": QuotaWindow("day", limit_day, _next_day),
+        "month": QuotaWindow("month", limit_month, _next_month),
+    }
+
+
+def dump_windows(windows):
+    return {window.name: [window.count, window.reset_at] for window in windows.values()}
+
+
+def restore_windows(windows, saved, now):
+    """
+    Restores the counters of the windows which are still current
+    """
+    for window in windows.values():
+        if window.name not in saved:
+            continue
+
+        saved_count, saved_reset_at = saved[window.name]
+        window.roll(now)
+
+        if saved_reset_at == window.reset_at:
+            window.count = max(window.count, saved_count)
+
+
+class Quota():
+    """
+    API usage quota of a single API key, shared by every adapter using it
+    """
+
+    def __init__(self, api_key, limit_minute, limit_day, limit_month):
+        self.api_key = api_key
+        self.key_id = get_key_id(api_key)
+        self.lock = threading.Lock()
+
+        self.windows = create_windows(limit_minute, limit_day, limit_month)
+        self.declared_limits = {}
+        self.shares = {}
+        self.resting_until = 0
+
+    def declare_limits(self, owner, limit_minute, limit_day, limit_month):
+        """
+        Sets the limits an owner (usually a source) configured for the key, replacing its previous ones.
+        The key follows the strictest limits declared by its owners, so they can go up on a reload as well as down.
+        """
+        with self.lock:
+            self.declared_limits[owner] = (limit_minute, limit_day, limit_month)
+            self._apply_limits()
+
+        self._update_metrics()
+
+    def release(self, owner):
+        """
+        Forgets the limits and the share of an owner which doesn't use the key anymore
+        """
+        with self.lock:
+            self.declared_limits.pop(owner, None)
+            self.shares.pop(owner, None)
+            self._apply_limits()
+
+        self._update_metrics()
+
+    def _apply_limits(self):
+        if not self.declared_limits:
+            return
+
+        for window_position, window in enumerate(self.windows.values()):
+            limit = min(limits[window_position] for limits in self.declared_limits.values())
+
+            if limit != window.limit:
+                logger.warning(f"IQAir API key {self.key_id}: changing the {window.name} limit from {window.limit} to {limit}")
+                window.limit = limit
+
+    def set_share(self, owner, weight):
+        """
+        Declares how much of the quota an owner (usually a source) is entitled to
+        """
+        with self.lock:
+            self.shares[owner] = weight
+
+    def get_share(self, owner):
+        with self.lock:
+            total_weight = sum(self.shares.values())
+
+            if owner not in self.shares or total_weight <= 0:
+                return 1.0
+
+            return self.shares[owner] / total_weight
+
+    def snapshot(self, now=None):
+        """
+        Returns the limit, usage and reset time of every window
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            result = {}
+
+            for window in self.windows.values():
+                window.roll(now)
+                result[window.name] = {
+                    "limit": window.limit,
+                    "count": window.count,
+                    "reset_at": window.reset_at,
+                }
+
+            return result
+
+    def dump(self):
+        with self.lock:
+            return dump_windows(self.windows)
+
+    def restore(self, saved, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            restore_windows(self.windows, saved, now)
+
+        self._update_metrics()
+
+    def headroom(self, now=None):
+        """
+        Returns the remaining fraction of the tightest window, -1 while the key is resting
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            if now < self.resting_until:
+                return -1.0
+
+            for window in self.windows.values():
+                window.roll(now)
+
+            return min(window.remaining() / max(1, window.limit) for window in self.windows.values())
+
+    def acquire(self, now=None):
+        """
+        Reserves a request slot if the key isn't resting and every window allows it
+
+        :return: (0.0, None) if a slot was reserved,
+                 otherwise the exact wait time and the name of the blocking window ("rest" for a resting key)
+        :rtype: tuple
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            if now < self.resting_until:
+                return self.resting_until - now, "rest"
+
+            wait_seconds = 0.0
+            blocking_window = None
+
+            for window in self.windows.values():
+                window.roll(now)
+                window_wait = window.wait_time(now)
+
+                if window_wait > wait_seconds:
+                    wait_seconds = window_wait
+                    blocking_window = window.name
+
+            if blocking_window is None:
+                for window in self.windows.values():
+                    window.count += 1
+
+        self._update_metrics()
+        return wait_seconds, blocking_window
+
+    def exhaust(self, window_name="minute", now=None):
+        """
+        Marks a window as used up, e.g. when the API replied with 429
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            window = self.windows[window_name]
+            window.roll(now)
+            window.count = max(window.count, window.limit)
+
+        self._update_metrics()
+
+    def rest(self, seconds, reason, now=None):
+        """
+        Stops granting request slots for a while, e.g. when the API rejected the key
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            self.resting_until = max(self.resting_until, now + seconds)
+
+        logger.warning(f"IQAir API key {self.key_id} is resting for {seconds:.0f} sec: {reason}")
+        MetricsHandler.inc("airquality_iqair_quota_rests_total", 1, key=self.key_id, reason=reason)
+        self._update_metrics(now)
+
+    def wait_time(self, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            for window in self.windows.values():
+                window.roll(now)
+
+            return max([window.wait_time(now) for window in self.windows.values()] + [self.resting_until - now])
+
+    def _update_metrics(self, now=None):
+        if now is None:
+            now = time.time()
+
+        for window in self.windows.values():
+            MetricsHandler.set("airquality_iqair_quota_used", window.count, key=self.key_id, window=window.name)
+            MetricsHandler.set("airquality_iqair_quota_limit", window.limit, key=self.key_id, window=window.name)
+
+        MetricsHandler.set("airquality_iqair_quota_resting", 1 if now < self.resting_until else 0, key=self.key_id)
+
+
+def get_quota(api_key, limit_minute, limit_day, limit_month, owner=None):
+    """
+    Returns the process-wide quota of an API key, creating it on first use
+
+    :param owner: name of the user of the key (usually a source) declaring the limits
+    """
+    with _quotas_lock:
+        if not _quotas:
+            MetricsHandler.init("airquality_iqair_quota_used", "gauge", "IQAir Adapter plugin, API requests used in the current quota window")
+            MetricsHandler.init("airquality_iqair_quota_limit", "gauge", "IQAir Adapter plugin, API requests allowed per quota window")
+            MetricsHandler.init("airquality_iqair_quota_resting", "gauge", "IQAir Adapter plugin, 1 while an API key is rested after a rejection")
+            MetricsHandler.init("airquality_iqair_quota_rests_total", "counter", "IQAir Adapter plugin, times an API key was rested")
+
+        if api_key not in _quotas:
+            _quotas[api_key] = Quota(api_key, limit_minute, limit_day, limit_month)
+            logger.debug(f"Created quota for IQAir API key {_quotas[api_key].key_id}")
+
+        quota = _quotas[api_key]
+
+    quota.declare_limits(owner, limit_minute, limit_day, limit_month)
+    return quota
+
+
+def redact(text):
+    """
+    Replaces the API keys known to the process with their identifiers.
+    Keys shorter than 8 characters aren't real IQAir keys and would mangle unrelated text.
+    """
+    with _quotas_lock:
+        key_ids = [(api_key, quota.key_id) for api_key, quota in _quotas.items() if len(str(api_key)) >= 8]
+
+    for api_key, key_id in key_ids:
+        if api_key in text:
+            text = text.replace(api_key, f"<key {key_id}>")
+
+    return text
+
+
+class KeyRedactingFilter(logging.Filter):
+    """
+    Redacts the API keys from the messages and tracebacks of log records,
+    e.g. the URL of a failed request in the message of a requests exception
+    """
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted_message = redact(message)
+
+        if redacted_message != message:
+            record.msg, record.args = redacted_message, None
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+
+        return True
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  Retries with exponential backoff and full jitter
+
+"""
+
+import asyncio
+import logging
+import random
+
+from .exceptions import (
+    UsageLimitsHitException,
+    CircuitOpenException,
+)
+from .quota import KeyRedactingFilter
+
+
+logger = logging.getLogger(__name__)
+logger.addFilter(KeyRedactingFilter())
+
+
+class RetryPolicy():
+    """
+    Number of attempts and delays between them: a random delay between 0 and
+    base_delay * 2^(attempt - 1), capped at max_delay ("full jitter")
+    """
+
+    def __init__(self, attempts=5, base_delay=1.0, max_delay=30.0):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def next_delay(self, func, attempt, error):
+        """
+        Returns how long to wait before the next attempt, or raises the error when there shouldn't be one.
+        A circuit which is open isn't retried; hitting the usage limits is retried without
+        a delay, since the next attempt waits for the quota anyway.
+        """
+        if isinstance(error, CircuitOpenException) or attempt >= self.attempts:
+            raise error
+
+        if isinstance(error, UsageLimitsHitException):
+            logger.warning(f"Retry #{attempt} for function: {func.__name__} hit the usage limits, retrying after the quota wait")
+            return 0.0
+
+        delay = self.delay(attempt)
+        logger.error(f"Retry #{attempt} for function: {func.__name__} failed: {error}, next attempt in {delay:.1f} sec")
+        return delay
+
+
+def retry(func):
+    """
+    Retries a method according to the retry_policy of its object.
+    The delays are interrupted when the object is stopped: the last error is raised then.
+    """
+    def wrap(self, *args, **kwargs):
+
+        current_attempt = 0
+
+        while True:
+            current_attempt += 1
+
+            try:
+                return func(self, *args, **kwargs)
+
+            except Exception as e:
+                delay = self.retry_policy.next_delay(func, current_attempt, e)
+
+                if delay and not self.pause(delay):
+                    raise
+
+    return wrap
+
+
+def async_retry(func):
+    """
+    Retries a coroutine method according to the retry_policy of its object
+    """
+    async def wrap(self, *args, **kwargs):
+
+        current_attempt = 0
+
+        while True:
+            current_attempt += 1
+
+            try:
+                return await func(self, *args, **kwargs)
+
+            except Exception as e:
+                delay = self.retry_policy.next_delay(func, current_attempt, e)
+
+                if delay:
+                    await asyncio.sleep(delay)
+
+    return wrap
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  Target scheduler
+
+"""
+
+import threading
+import itertools
+import logging
+import heapq
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler():
+    """
+    Priority queue of items ordered by their due time
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.closed = False
+
+    def __len__(self):
+        with self.condition:
+            return len(self.queue)
+
+    def schedule(self, item, due_at):
+        with self.condition:
+            heapq.heappush(self.queue, (due_at, next(self.sequence), item))
+            self.condition.notify()
+
+    def get(self):
+        """
+        Blocks until the earliest item is due
+
+        :return: the item, or None if the scheduler was closed
+        """
+        with self.condition:
+            while not self.closed:
+                if not self.queue:
+                    self.condition.wait()
+                    continue
+
+                wait_seconds = self.queue[0][0] - time.time()
+
+                if wait_seconds <= 0:
+                    _, _, item = heapq.heappop(self.queue)
+                    return item
+
+                self.condition.wait(timeout=wait_seconds)
+
+            return None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,too-few-public-methods
+"""
+
+  IQAir API Adapter
+  Expiry of stale series
+
+  Series carrying the location labels of a target (country, state, city) are removed:
+  - the readings, when no source refreshed the target within its TTL (e.g. it keeps failing),
+  - all of them and the history, when no source polled the target within its TTL (e.g. it was removed from the configuration),
+  - the ones of the least recently refreshed targets, when a source has more series than its limit;
+    the source stops polling these targets until it's reconfigured.
+
+"""
+
+import threading
+import logging
+import time
+
+from pyp8s import MetricsHandler
+
+from .history import get_history_store
+
+
+logger = logging.getLogger(__name__)
+
+READING_METRICS = (
+    "airquality_aqius",
+    "airquality_aqicn",
+    "airquality_temperature",
+    "airquality_pressure_hpa",
+    "airquality_humidity",
+    "airquality_wind_speed",
+    "airquality_wind_direction",
+    "airquality_last_update",
+)
+
+
+def _series_target_key(labels):
+    if "country" not in labels or "state" not in labels or "city" not in labels or labels.get("provider", "IQAir") != "IQAir":
+        return None
+
+    return (labels["country"], labels["state"], labels["city"])
+
+
+def remove_series(metric, should_remove):
+    """
+    Removes the labelsets matching should_remove(labels) from a pyp8s metric (its stored data,
+    series rendered at scrape time such as histograms are left alone).
+    The data dict is replaced rather than changed, so a concurrent render keeps iterating the old one;
+    a labelset created in between is lost until it's set again.
+
+    :return: number of removed labelsets
+    """
+    data = metric.data
+    kept = {labelset_key: labelset for labelset_key, labelset in list(data.items()) if not should_remove(labelset.get("labels", {}))}
+    removed_count = len(data) - len(kept)
+
+    if removed_count:
+        metric.data = kept
+
+    return removed_count
+
+
+def labelset_key(labels):
+    """
+    :return: the key pyp8s stores a labelset under in the data of a metric
+    """
+    return "_".join(f"{label_name}_{label_value}" for label_name, label_value in sorted(labels.items(), key=lambda item: item[0].casefold()))
+
+
+class TargetSeries():
+    """
+    Series of one target. The labels are built once, and a value is set directly in the labelset
+    pyp8s keeps for it instead of crafting its key (and a debug message) on every update.
+    A labelset is looked up again once removing stale series replaced the data of its metric.
+    """
+
+    __slots__ = ("labels", "metrics", "labelsets")
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.metrics = MetricsHandler.get_metrics()
+        self.labelsets = {}
+
+    def set(self, metric_name, value, extra_label=None):
+        """
+        :param extra_label: (name, value) of a label preceding the target labels
+        """
+        cache_key = metric_name if extra_label is None else (metric_name, extra_label)
+        cached = self.labelsets.get(cache_key)
+
+        if cached is not None and cached[0] is self.metrics[metric_name].data:
+            cached[1]["value"] = value
+            return
+
+        labels = self.labels if extra_label is None else {extra_label[0]: extra_label[1], **self.labels}
+        MetricsHandler.set(metric_name, value, **labels)
+
+        data = self.metrics[metric_name].data
+        labelset = data.get(labelset_key(labels))
+
+        if labelset is not None:
+            self.labelsets[cache_key] = (data, labelset)
+
+
+class SeriesRegistry():
+    """
+    When every source last polled and refreshed each of its targets
+    """
+
+    def __init__(self, sweep_interval=60):
+        self.sweep_interval = sweep_interval
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.limits = {}
+        self.evicted = {}
+        self.swept_at = time.monotonic()
+
+    def record(self, source, target_key, ttl, refreshed, limit=None, now=None):
+        """
+        Records a poll of a target by a source
+
+        :param ttl: seconds the series of the target stay without being polled (refreshed), 0 to keep them forever
+        :param refreshed: whether the readings of the target are current (polled successfully, or skipped as fresh)
+        :param limit: maximum series of the source, None for no limit
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            if target_key in self.evicted.get(source, ()):
+                return
+
+            entry = self.entries.setdefault(source, {}).setdefault(target_key, {"polled_at": now, "refreshed_at": 0, "ttl": ttl})
+            entry["polled_at"] = now
+            entry["ttl"] = ttl
+
+            if refreshed:
+                entry["refreshed_at"] = now
+
+            self.limits[source] = limit
+
+    def is_evicted(self, source, target_key):
+        """
+        :return: True if the target was evicted from the source over its series limit
+        """
+        with self.lock:
+            return target_key in self.evicted.get(source, ())
+
+    def forget_evictions(self, source):
+        """
+        Lets a source poll the targets it evicted over its series limit again
+
+        :return: set of the target keys which were evicted
+        """
+        with self.lock:
+            return self.evicted.pop(source, set())
+
+    def forget_source(self, source):
+        """
+        Forgets a removed source: the series and the history of its targets which no other source polls are removed
+        """
+        with self.lock:
+            source_entries = self.entries.pop(source, {})
+            self.limits.pop(source, None)
+            self.evicted.pop(source, None)
+            polled_targets = {target_key for other_entries in self.entries.values() for target_key in other_entries}
+
+        stale_targets = set(source_entries).difference(polled_targets)
+        self._remove(MetricsHandler.get_metrics(), stale_targets, set())
+        get_history_store().discard(stale_targets)
+
+    def maybe_sweep(self, now=None):
+        """
+        Sweeps if the previous sweep is older than sweep_interval; only one caller sweeps at a time
+        """
+        with self.lock:
+            if time.monotonic() - self.swept_at < self.sweep_interval:
+                return
+
+            self.swept_at = time.monotonic()
+
+        self.sweep(now=now)
+
+    def sweep(self, now=None):
+        if now is None:
+            now = time.time()
+
+        metrics = MetricsHandler.get_metrics()
+        series_counts = self._count_series(metrics)
+        evictions = []
+
+        with self.lock:
+            known_targets = {target_key for source_entries in self.entries.values() for target_key in source_entries}
+
+            for source, source_entries in self.entries.items():
+                for target_key, entry in list(source_entries.items()):
+                    if entry["ttl"] and now - entry["polled_at"] > entry["ttl"]:
+                        del source_entries[target_key]
+                        evictions.append((source, target_key, "ttl"))
+
+                evictions.extend((source, target_key, "limit") for target_key in self._over_limit(source, series_counts))
+
+            polled_targets = {target_key for source_entries in self.entries.values() for target_key in source_entries}
+            refreshed_targets = {
+                target_key
+                for source_entries in self.entries.values()
+                for target_key, entry in source_entries.items()
+                if not entry["ttl"] or now - entry["refreshed_at"] <= entry["ttl"]
+            }
+            outdated_targets = polled_targets.difference(refreshed_targets)
+
+            for source, source_entries in self.entries.items():
+                evictions.extend((source, target_key, "outdated") for target_key in outdated_targets.intersection(source_entries))
+
+        stale_targets = known_targets.difference(polled_targets)
+        removed_counts = self._remove(metrics, stale_targets, outdated_targets)
+        get_history_store().discard(stale_targets)
+
+        for source, target_key, reason in evictions:
+            if removed_counts.get(target_key):
+                MetricsHandler.inc("airquality_iqair_series_evicted_total", removed_counts[target_key], source=source, reason=reason)
+
+        with self.lock:
+            for source, source_entries in self.entries.items():
+                active_count = sum(series_counts.get(target_key, 0) - removed_counts.get(target_key, 0) for target_key in source_entries)
+                MetricsHandler.set("airquality_iqair_series_active", active_count, source=source)
+
+    @staticmethod
+    def _count_series(metrics):
+        """
+        :return: target key -> number of series carrying its location labels
+        """
+        series_counts = {}
+
+        for metric in list(metrics.values()):
+            for labelset in list(metric.data.values()):
+                target_key = _series_target_key(labelset.get("labels", {}))
+
+                if target_key is not None:
+                    series_counts[target_key] = series_counts.get(target_key, 0) + 1
+
+        return series_counts
+
+    def _over_limit(self, source, series_counts):
+        """
+        Forgets the least recently refreshed targets of a source until its series fit in its limit
+
+        :return: list of the forgotten target keys
+        """
+        limit = self.limits.get(source)
+        source_entries = self.entries[source]
+        active_count = sum(series_counts.get(target_key, 0) for target_key in source_entries)
+        result = []
+
+        if limit is None or active_count <= limit:
+            return result
+
+        for target_key, _ in sorted(source_entries.items(), key=lambda item: (item[1]["refreshed_at"], item[1]["polled_at"])):
+            if active_count <= limit:
+                break
+
+            del source_entries[target_key]
+            active_count -= series_counts.get(target_key, 0)
+            result.append(target_key)
+
+        self.evicted.setdefault(source, set()).update(result)
+
+        logger.warning(f"Source '{source}' is over its limit of {limit} series, evicting {len(result)} targets")
+        return result
+
+    @staticmethod
+    def _remove(metrics, stale_targets, outdated_targets):
+        """
+        Removes every series of the stale targets, and the readings of the outdated ones
+
+        :return: target key -> number of removed series
+        """
+        removed_counts = {}
+
+        if not stale_targets and not outdated_targets:
+            return removed_counts
+
+        for metric_name, metric in list(metrics.items()):
+            def should_remove(labels, metric_name=metric_name):
+                target_key = _series_target_key(labels)
+
+                if target_key in stale_targets or (target_key in outdated_targets and metric_name in READING_METRICS):
+                    removed_counts[target_key] = removed_counts.get(target_key, 0) + 1
+                    return True
+
+                return False
+
+            remove_series(metric, should_remove)
+
+        if removed_counts:
+            logger.info(f"Removed {sum(removed_counts.values())} stale series of {len(removed_counts)} targets")
+
+        return removed_counts
+
+
+_registry = SeriesRegistry()
+
+
+def get_series_registry():
+    return _registry
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API Adapter
+  HTTP session
+
+"""
+
+import threading
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .quota import KeyRedactingFilter
+
+
+logger = logging.getLogger(__name__)
+
+# urllib3 logs the URL of requests, which carries the API key, when connecting and retrying
+for urllib3_logger_name in ("urllib3.connectionpool", "urllib3.util.retry"):
+    logging.getLogger(urllib3_logger_name).addFilter(KeyRedactingFilter())
+
+_timings = threading.local()
+
+
+class TimedConnectionMixin():  # pylint: disable=too-few-public-methods
+    """
+    Accumulates the time spent on opening connections (DNS, TCP and TLS) in the current thread
+    """
+
+    def connect(self):
+        started_at = time.perf_counter()
+
+        try:
+            super().connect()
+
+        finally:
+            _timings.connect_seconds = getattr(_timings, "connect_seconds", 0.0) + time.perf_counter() - started_at
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Transport adapter whose connections report how long they took to open
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+def pop_connect_time():
+    """
+    Returns the connection time accumulated by the current thread since the previous call
+    """
+    connect_seconds = getattr(_timings, "connect_seconds", 0.0)
+    _timings.connect_seconds = 0.0
+    return connect_seconds
+
+
+def build_session(pool_size=1, retries=3, retry_backoff_factor=0.5):
+    """
+    Creates a keep-alive session with a bounded connection pool
+    and transport-level retries for connections which couldn't be opened, the request wasn't sent then.
+    Timeouts and 5xx responses are left to the retry policy of the adapter, so that every
+    attempt takes its quota slot and is seen by the circuit breaker; 429 is handled by the usage limits logic.
+    """
+
+    retry_strategy = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=retry_backoff_factor,
+        allowed_methods=["GET"],
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+    http_adapter = TimedHTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        pool_block=True,
+        max_retries=retry_strategy,
+    )
+
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("https://", http_adapter)
+    session.mount("http://", http_adapter)
+
+    logger.debug(f"HTTP session created: pool_size={pool_size} retries={retries} retry_backoff_factor={retry_backoff_factor}")
+    return session
+
+
+def get_pool_stats(session):
+    """
+    Returns the number of connections opened and requests served
+    across all connection pools of the session
+    """
+
+    stats = {
+        "opened": 0,
+        "requests": 0,
+    }
+
+    for http_adapter in set(session.adapters.values()):
+        pools = http_adapter.poolmanager.pools
+
+        for pool_key in pools.keys():
+            connection_pool = pools.get(pool_key)
+
+            if connection_pool is None:
+                continue
+
+            stats["opened"] += connection_pool.num_connections
+            stats["requests"] += connection_pool.num_requests
+
+    stats["reused"] = max(0, stats["requests"] - stats["opened"])
+    return stats
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  Providers
+  Target sharding
+
+  Rendezvous (highest random weight) hashing: every node scores every key and the key
+  goes to the node with the highest score. Adding or removing a node only moves
+  the keys which that node wins or owned.
+
+"""
+
+import hashlib
+
+
+def rendezvous_score(key, node, salt=""):
+    digest = hashlib.blake2b(f"{salt}|{node}|{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rendezvous_owner(key, nodes_count, salt=""):
+    """
+    Returns the index of the node owning the key, out of nodes_count nodes
+    """
+    return max(range(nodes_count), key=lambda node: rendezvous_score(key, node, salt))
+
+
+def select_shard(items, key_func, shard_index, shard_count, salt=""):
+    """
+    Returns the items owned by shard_index out of shard_count shards
+
+    :param key_func: Returns a stable string key of an item
+    :type key_func: callable
+    """
+    if shard_count <= 1:
+        return list(items)
+
+    return [item for item in items if rendezvous_owner(key_func(item), shard_count, salt) == shard_index]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error
+"""
+
+  Configuration reload
+
+  The configuration is reloaded on SIGHUP, or when the file changes
+  if "reload.watch_interval" is set.
+
+"""
+
+import threading
+import logging
+import signal
+import os
+
+from configuration import load_configuration
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigReloader():
+    """
+    Tells the main loop when the configuration should be reloaded
+    """
+
+    def __init__(self, filename, watch_interval=0):
+        self.filename = filename
+        self.watch_interval = watch_interval
+
+        self.requested = threading.Event()
+        self.file_signature = self._file_signature()
+
+    def install_signal_handler(self):
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_sighup)
+
+    def _on_sighup(self, signum, frame):  # pylint: disable=unused-argument
+        logger.info("Received SIGHUP, reloading the configuration")
+        self.requested.set()
+
+    def _file_signature(self):
+        try:
+            file_stat = os.stat(self.filename)
+            return (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino)
+
+        except OSError:
+            return None
+
+    def wait(self, timeout):
+        """
+        Waits at most timeout seconds for a reload to be due
+
+        :return: True if the configuration should be reloaded
+        """
+        if self.watch_interval:
+            timeout = min(timeout, self.watch_interval)
+
+        if self.requested.wait(timeout=timeout):
+            self.requested.clear()
+            self.file_signature = self._file_signature()
+            return True
+
+        if not self.watch_interval:
+            return False
+
+        file_signature = self._file_signature()
+
+        if file_signature is None or file_signature == self.file_signature:
+            return False
+
+        logger.info(f"Configuration file '{self.filename}' changed, reloading")
+        self.file_signature = file_signature
+        return True
+
+    def load_sources(self):
+        """
+        :return: source configurations from the file, None if it can't be loaded
+        """
+        try:
+            return load_configuration(self.filename).get("sources", {})
+
+        except Exception as e:
+            logger.error(f"Can't reload configuration file '{self.filename}', keeping the running configuration ({e.__class__.__name__}): {e}")
+            return None
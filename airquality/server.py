@@ -33,21 +33,214 @@
 """
 
 import logging
+import time
+import sys
+import os
 
 from pyp8s import MetricsHandler
 
-from providers import providers
+from providers import providers, UnknownProviderException
+from state import StateStore
+from workers import WorkerPool
+from reloader import ConfigReloader
+from shutdown import ShutdownRequested, install_signal_handlers
+from engine import SourceRunner, get_adapter_class
+from history_api import serve_history
 from configuration import (
+    CONFIG_FILENAME,
     METRICS_LISTEN_ADDRESS,
     METRICS_LISTEN_PORT,
     SOURCES,
+    ENGINE,
+    STATE_FILENAME,
+    STATE_SAVE_INTERVAL,
+    REPLICA_INDEX,
+    REPLICA_COUNT,
+    WORKERS_PROCESSES,
+    WORKERS_METRICS_FORWARD_INTERVAL,
+    WORKERS_SHUTDOWN_TIMEOUT,
+    RELOAD_WATCH_INTERVAL,
+    SHUTDOWN_TIMEOUT,
+    HISTORY_LISTEN_ADDRESS,
+    HISTORY_LISTEN_PORT,
 )
 
 logger = logging.getLogger("server")
 
 
-if __name__ == "__main__":
+def save_state(state_store, adapters, shutdown=None):
+    if state_store is None:
+        return
+
+    sources_state = {}
+
+    for source_name, adapter in adapters.items():
+        if hasattr(adapter, "dump_state"):
+            sources_state[source_name] = adapter.dump_state()
+
+    state_store.save(sources_state, shutdown=shutdown)
+
+
+def report_shutdown(started_at, stopped_in_time):
+    """
+    Logs and exports how long stopping took
+
+    :return: shutdown summary, saved with the final state
+    """
+    duration = time.monotonic() - started_at
+    MetricsHandler.set("airquality_shutdown_duration_seconds", duration)
+
+    if stopped_in_time:
+        logger.info(f"Stopped in {duration:.1f} sec")
+    else:
+        logger.error(f"Not everything stopped within the shutdown timeout of {SHUTDOWN_TIMEOUT} sec")
+
+    return {
+        "duration": round(duration, 3),
+        "clean": stopped_in_time,
+        "finished_at": int(time.time()),
+    }
+
+
+def replica_sources(sources):
+    """
+    Returns the source configurations with the replica index and count,
+    so that every replica polls only its share of the targets
+    """
+    if REPLICA_COUNT <= 1:
+        return sources
+
+    return {
+        source_name: dict(source_config, replica_index=REPLICA_INDEX, replica_count=REPLICA_COUNT)
+        for source_name, source_config in sources.items()
+    }
+
+
+def reload_sources(source_runner, source_configs, sources):
+    """
+    Applies reloaded source configurations: removed sources are stopped and added ones started.
+    A changed source is reconfigured in place when its adapter supports the change,
+    otherwise it's recreated with the state of the running adapter.
+    """
+    sources = replica_sources(sources)
+
+    for source_name in set(source_configs).difference(sources):
+        logger.info(f"Removing source '{source_name}'")
+        source_runner.remove(source_name, release=True)
+        del source_configs[source_name]
+
+    for source_name, source_config in sources.items():
+        if source_configs.get(source_name) == source_config:
+            continue
+
+        running_adapter = source_runner.adapters.get(source_name)
+
+        if running_adapter is not None and hasattr(running_adapter, "reconfigure") and running_adapter.reconfigure(source_config):
+            source_configs[source_name] = source_config
+            continue
+
+        try:
+            adapter_class = get_adapter_class(providers.get(source_config.get('provider')), ENGINE)
+            provider_adapter = adapter_class(adapter_config=source_config, thread_name=source_name)
+
+        except Exception as e:
+            logger.error(f"Can't initialise source '{source_name}', keeping the running configuration ({e.__class__.__name__}): {e}")
+            continue
+
+        if running_adapter is not None:
+            logger.info(f"Recreating source '{source_name}'")
+            source_runner.remove(source_name)
+
+            if hasattr(running_adapter, "dump_state") and hasattr(provider_adapter, "load_state"):
+                provider_adapter.load_state(running_adapter.dump_state())
+        else:
+            logger.info(f"Adding source '{source_name}'")
+
+        source_runner.add(source_name, provider_adapter)
+        source_configs[source_name] = source_config
+
+
+def run_sources(sources, state_store, saved_sources, adapter_classes, reloader):
+    adapters = {}
+    source_configs = dict(sources)
+
+    for source_name, source_config in sources.items():
+        logger.info(f"Initialising source '{source_name}'")
+        provider_adapter = adapter_classes[source_name](adapter_config=source_config, thread_name=source_name)
+
+        if source_name in saved_sources and hasattr(provider_adapter, "load_state"):
+            provider_adapter.load_state(saved_sources[source_name])
+
+        adapters[source_name] = provider_adapter
+
+    source_runner = SourceRunner(adapters, engine=ENGINE)
+    saved_at = time.monotonic()
+
+    try:
+        source_runner.start()
+
+        while True:
+            if reloader.wait(max(0.0, STATE_SAVE_INTERVAL - (time.monotonic() - saved_at))):
+                reloaded_sources = reloader.load_sources()
 
+                if reloaded_sources is not None:
+                    reload_sources(source_runner, source_configs, reloaded_sources)
+
+            if time.monotonic() - saved_at >= STATE_SAVE_INTERVAL:
+                save_state(state_store, adapters)
+                saved_at = time.monotonic()
+
+    except ShutdownRequested as e:
+        logger.warning(f"{e}, stopping the sources")
+
+    finally:
+        shutdown_started_at = time.monotonic()
+        stopped_in_time = source_runner.stop(timeout=SHUTDOWN_TIMEOUT)
+        save_state(state_store, adapters, shutdown=report_shutdown(shutdown_started_at, stopped_in_time))
+
+    return stopped_in_time
+
+
+def run_worker_pool(sources, state_store, saved_sources, reloader):
+    worker_pool = WorkerPool(
+        sources,
+        WORKERS_PROCESSES,
+        engine=ENGINE,
+        saved_sources=saved_sources,
+        forward_interval=WORKERS_METRICS_FORWARD_INTERVAL,
+        state_interval=STATE_SAVE_INTERVAL,
+        shutdown_timeout=WORKERS_SHUTDOWN_TIMEOUT,
+    )
+    saved_at = time.monotonic()
+
+    try:
+        worker_pool.start()
+
+        while True:
+            if reloader.wait(min(STATE_SAVE_INTERVAL, 10)):
+                logger.warning("Reloading the configuration isn't supported with worker processes, restart to apply it")
+
+            worker_pool.check()
+
+            if state_store is not None and time.monotonic() - saved_at >= STATE_SAVE_INTERVAL:
+                state_store.save(worker_pool.dump_state())
+                saved_at = time.monotonic()
+
+    except ShutdownRequested as e:
+        logger.warning(f"{e}, stopping the worker processes")
+
+    finally:
+        shutdown_started_at = time.monotonic()
+        stopped_in_time = worker_pool.stop()
+        shutdown = report_shutdown(shutdown_started_at, stopped_in_time)
+
+        if state_store is not None:
+            state_store.save(worker_pool.dump_state(), shutdown=shutdown)
+
+    return stopped_in_time
+
+
+def main():
     MetricsHandler.init("airquality_aqius", "gauge", "AQI value based on US EPA standard")
     MetricsHandler.init("airquality_aqicn", "gauge", "AQI value based on China MEP standard")
     MetricsHandler.init("airquality_temperature", "gauge", "Temperature in Celsius")
@@ -55,11 +248,58 @@ if __name__ == "__main__":
     MetricsHandler.init("airquality_humidity", "gauge", "Humidity %")
     MetricsHandler.init("airquality_wind_speed", "gauge", "Wind speed (m/s)")
     MetricsHandler.init("airquality_wind_direction", "gauge", "Wind direction, as an angle of 360° (N=0, E=90, S=180, W=270)")
+    MetricsHandler.init("airquality_shutdown_duration_seconds", "gauge", "Time it took to stop the sources, set while shutting down")
+    MetricsHandler.init("airquality_last_shutdown_duration_seconds", "gauge", "Time it took to stop the sources at the previous shutdown, from the state file")
 
-    MetricsHandler.serve(listen_address=METRICS_LISTEN_ADDRESS, listen_port=METRICS_LISTEN_PORT)
+    if not 0 <= REPLICA_INDEX < REPLICA_COUNT:
+        logger.error(f"Replica index {REPLICA_INDEX} is out of range for {REPLICA_COUNT} replicas")
+        sys.exit(1)
+
+    adapter_classes = {}
 
     for source_name, source_config in SOURCES.items():
-        logger.info(f"Initialising source '{source_name}'")
-        provider_module = providers.get(source_config['provider'])
-        provider_adapter = provider_module.Adapter(adapter_config=source_config)
-        provider_adapter.start()
+        try:
+            adapter_classes[source_name] = get_adapter_class(providers.get(source_config.get('provider')), ENGINE)
+        except (UnknownProviderException, ValueError) as e:
+            logger.error(f"Can't initialise source '{source_name}': {e}")
+            sys.exit(1)
+
+    MetricsHandler.serve(listen_address=METRICS_LISTEN_ADDRESS, listen_port=METRICS_LISTEN_PORT)
+
+    if HISTORY_LISTEN_PORT:
+        serve_history(HISTORY_LISTEN_ADDRESS, HISTORY_LISTEN_PORT)
+
+    if STATE_FILENAME:
+        state_store = StateStore(STATE_FILENAME)
+        saved_state = state_store.load()
+        saved_sources = saved_state.get("sources", {})
+
+        if "shutdown" in saved_state:
+            previous_shutdown = saved_state["shutdown"]
+            MetricsHandler.set("airquality_last_shutdown_duration_seconds", previous_shutdown.get("duration", 0), clean=str(previous_shutdown.get("clean", False)).lower())
+    else:
+        state_store = None
+        saved_sources = {}
+
+    if REPLICA_COUNT > 1:
+        logger.info(f"Running as replica {REPLICA_INDEX} of {REPLICA_COUNT}")
+
+    sources = replica_sources(SOURCES)
+
+    reloader = ConfigReloader(CONFIG_FILENAME, watch_interval=RELOAD_WATCH_INTERVAL)
+    reloader.install_signal_handler()
+    install_signal_handlers()
+
+    if WORKERS_PROCESSES:
+        stopped_in_time = run_worker_pool(sources, state_store, saved_sources, reloader)
+    else:
+        stopped_in_time = run_sources(sources, state_store, saved_sources, adapter_classes, reloader)
+
+    if not stopped_in_time:
+        logger.error("Exiting without waiting for the sources which didn't stop")
+        logging.shutdown()
+        os._exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error
+"""
+
+  Graceful shutdown
+
+  SIGTERM and SIGINT interrupt the main loop with ShutdownRequested, the server then
+  stops the sources and saves the state within the shutdown timeout.
+
+"""
+
+import threading
+import logging
+import signal
+
+
+logger = logging.getLogger(__name__)
+
+_shutdown_started = threading.Event()
+
+
+class ShutdownRequested(BaseException):
+    """
+    Raised in the main thread when a shutdown signal is received.
+    Like KeyboardInterrupt it isn't an Exception, so the broad handlers of the main loop
+    (loading the configuration, saving the state) can't swallow it.
+    """
+    def __init__(self, signal_name):
+        super().__init__(signal_name)
+        self.signal_name = signal_name
+
+    def __str__(self):
+        return f"Received {self.signal_name}"
+
+
+def _on_signal(signum, frame):  # pylint: disable=unused-argument
+    signal_name = signal.Signals(signum).name
+
+    if _shutdown_started.is_set():
+        logger.warning(f"Received {signal_name}, already shutting down")
+        return
+
+    _shutdown_started.set()
+    raise ShutdownRequested(signal_name)
+
+
+def install_signal_handlers():
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, _on_signal)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error
+"""
+
+  State file
+
+"""
+
+import os
+import gzip
+import json
+import logging
+import tempfile
+import time
+
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+
+class StateStore():
+    """
+    Keeps the exporter state in a compact JSON file, gzipped if the filename ends with ".gz".
+    Writes are atomic: the state is written into a temporary file which then replaces the old one.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.compress = filename.endswith(".gz")
+
+    def _open(self, path, mode):
+        if self.compress:
+            return gzip.open(path, mode)
+
+        return open(path, mode)  # pylint: disable=unspecified-encoding
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            logger.info(f"State file '{self.filename}' doesn't exist yet")
+            return {}
+
+        try:
+            with self._open(self.filename, "rb") as state_fh:
+                state = json.loads(state_fh.read())
+
+        except Exception as e:
+            logger.error(f"Can't read state file '{self.filename}' ({e.__class__.__name__}): {e}")
+            return {}
+
+        if state.get("version") != STATE_VERSION:
+            logger.warning(f"Ignored state file '{self.filename}' of an unsupported version: {state.get('version')}")
+            return {}
+
+        logger.info(f"Loaded state file '{self.filename}' saved at {state.get('saved_at')}")
+        return state
+
+    def save(self, sources, shutdown=None):
+        """
+        :param shutdown: how the last shutdown went, saved with the final state
+        """
+        state = {
+            "version": STATE_VERSION,
+            "saved_at": int(time.time()),
+            "sources": sources,
+        }
+
+        if shutdown is not None:
+            state["shutdown"] = shutdown
+        state_bytes = json.dumps(state, separators=(",", ":")).encode("utf-8")
+
+        state_dir = os.path.dirname(os.path.abspath(self.filename))
+        temp_fd, temp_path = tempfile.mkstemp(dir=state_dir, prefix=".state-")
+        os.close(temp_fd)
+
+        try:
+            with self._open(temp_path, "wb") as state_fh:
+                state_fh.write(state_bytes)
+
+            with open(temp_path, "rb") as state_fh:
+                os.fsync(state_fh.fileno())
+
+            os.replace(temp_path, self.filename)
+
+        except Exception as e:
+            logger.error(f"Can't write state file '{self.filename}' ({e.__class__.__name__}): {e}")
+            return False
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        logger.debug(f"Saved state file '{self.filename}' ({len(state_bytes)} bytes before compression)")
+        return True
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,too-few-public-methods
+"""
+
+  Worker processes
+
+  Sources (or target shards of a source) run in a pool of worker processes.
+  Workers forward changed metric values and new history readings to the parent, which alone serves them.
+
+"""
+
+import multiprocessing
+import threading
+import logging
+import signal
+import queue
+import time
+import os
+
+from pyp8s import MetricsHandler
+from pyp8s.metrics import Metric
+
+from providers import providers
+from providers.iqair.history import get_history_store
+from engine import SourceRunner, get_adapter_class
+
+
+logger = logging.getLogger(__name__)
+
+# Time a worker keeps, out of the shutdown timeout, to send its last metrics and state
+WORKER_STOP_MARGIN = 2
+
+# Gauges of the API key quotas: every worker has its divided share of a key, the key's usage and limit are their sums
+ADDED_UP_GAUGES = frozenset((
+    "airquality_iqair_quota_used",
+    "airquality_iqair_quota_limit",
+))
+
+
+def plan_units(sources, processes):
+    """
+    Splits the sources into units (a source, or one target shard of it) and assigns them to processes.
+    Shards of a source land in different processes; the API query limits of a unit are divided
+    by the number of processes using its most shared key.
+
+    :return: process index -> list of units
+    :rtype: dict
+    """
+    units = []
+
+    for source_name, source_config in sources.items():
+        shards = max(1, int(source_config.get("shards", 1)))
+        adapter_config = {key: value for key, value in source_config.items() if key != "shards"}
+
+        for shard_index in range(shards):
+            unit_config = dict(adapter_config)
+
+            if shards > 1:
+                unit_name = f"{source_name}/{shard_index}"
+                unit_config.update(shard_index=shard_index, shard_count=shards)
+            else:
+                unit_name = source_name
+
+            units.append({"name": unit_name, "source": source_name, "provider": source_config.get("provider"), "config": unit_config})
+
+    processes = max(1, min(int(processes), len(units)))
+    assignments = {process_index: [] for process_index in range(processes)}
+    key_processes = {}
+
+    for position, unit in enumerate(units):
+        process_index = position % processes
+        assignments[process_index].append(unit)
+
+        for api_key in _unit_api_keys(unit):
+            key_processes.setdefault(api_key, set()).add(process_index)
+
+    for unit in units:
+        api_keys = _unit_api_keys(unit)
+
+        if api_keys:
+            unit["config"]["quota_divisor"] = max(len(key_processes[api_key]) for api_key in api_keys)
+
+    return assignments
+
+
+def _unit_api_keys(unit):
+    """
+    Returns the API keys of a unit: "api_key" and the entries of "api_keys" (a key, or a dict with "api_key")
+    """
+    api_keys = [unit["config"]["api_key"]] if unit["config"].get("api_key") is not None else []
+
+    for entry in unit["config"].get("api_keys") or []:
+        api_keys.append(entry.get("api_key") if isinstance(entry, dict) else entry)
+
+    return [api_key for api_key in api_keys if api_key is not None]
+
+
+class MetricsForwarder():
+    """
+    Sends the metric values which changed, and the series which were removed, since the previous call to the parent process
+    """
+
+    def __init__(self, worker_index, channel):
+        self.worker_index = worker_index
+        self.channel = channel
+
+        self.excluded = set(MetricsHandler.get_metrics())
+        self.sent_definitions = {}
+        self.sent_values = {}
+
+    def forward(self):
+        definitions = {}
+        updates = []
+        removals = []
+
+        for metric_name, metric in list(MetricsHandler.get_metrics().items()):
+            if metric_name in self.excluded:
+                continue
+
+            definition = (metric.get_type(), metric.get_help())
+
+            if self.sent_definitions.get(metric_name) != definition:
+                definitions[metric_name] = definition
+                self.sent_definitions[metric_name] = definition
+
+            sent_values = self.sent_values.setdefault(metric_name, {})
+            labelsets = metric.get_labelsets()
+
+            for labelset_key in set(sent_values).difference(labelsets):
+                removals.append((metric_name, labelset_key))
+                del sent_values[labelset_key]
+
+            for labelset_key, labelset in list(labelsets.items()):
+                value = labelset["value"]
+
+                if labelset_key not in sent_values:
+                    updates.append((metric_name, labelset_key, labelset["labels_formatted"], value))
+                    sent_values[labelset_key] = value
+
+                elif sent_values[labelset_key] != value:
+                    updates.append((metric_name, labelset_key, None, value))
+                    sent_values[labelset_key] = value
+
+        if definitions or updates or removals:
+            self.channel.put(("metrics", self.worker_index, definitions, updates, removals))
+
+
+class WorkerSeries(Metric):
+    """
+    pyp8s metric which merges the values reported by the workers with the series of the parent process itself:
+    counters and the ADDED_UP_GAUGES are added up, any other gauge takes the value written last by any worker
+    """
+
+    def __init__(self, metric_name, local_metric=None):
+        super().__init__(metric_name=metric_name)
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.writes = 0
+
+        if local_metric is not None:
+            self.set_help(local_metric.get_help())
+            self.set_type(local_metric.get_type())
+            self.data = local_metric.data
+
+    def update(self, worker_index, labelset_key, labels_formatted, value):
+        with self.lock:
+            series = self.workers.setdefault(worker_index, {})
+            self.writes += 1
+
+            if labels_formatted is not None:
+                series[labelset_key] = {"value": value, "labels_formatted": labels_formatted, "written": self.writes}
+            elif labelset_key in series:
+                series[labelset_key]["value"] = value
+                series[labelset_key]["written"] = self.writes
+
+    def remove(self, worker_index, labelset_key):
+        with self.lock:
+            self.workers.get(worker_index, {}).pop(labelset_key, None)
+
+    def get_labelsets(self):
+        result = {labelset_key: dict(labelset) for labelset_key, labelset in list(self.data.items())}
+        added_up = self.get_type() == "counter" or self.metric_name in ADDED_UP_GAUGES
+        written = {}
+
+        with self.lock:
+            for series in self.workers.values():
+                for labelset_key, labelset in series.items():
+                    if labelset_key not in result:
+                        result[labelset_key] = {"value": labelset["value"], "labels_formatted": labelset["labels_formatted"]}
+
+                    elif added_up:
+                        result[labelset_key]["value"] += labelset["value"]
+
+                    elif labelset["written"] > written.get(labelset_key, 0):
+                        result[labelset_key]["value"] = labelset["value"]
+
+                    written[labelset_key] = max(written.get(labelset_key, 0), labelset["written"])
+
+        return result
+
+
+def worker_main(worker_index, units, engine, saved_states, channel, stop_reader, forward_interval, state_interval, shutdown_timeout):
+    """
+    Entry point of a worker process: runs the adapters of its units until the parent asks to stop
+    (or goes away) through stop_reader, the receiving end of a pipe.
+    Shutdown signals sent to the whole process group are left to the parent.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    forwarder = MetricsForwarder(worker_index, channel)
+    history_store = get_history_store()
+    history_store.track()
+    adapters = {}
+
+    for unit in units:
+        logger.info(f"Worker #{worker_index}: initialising source '{unit['name']}'")
+        adapter_class = get_adapter_class(providers.get(unit["provider"]), engine)
+        provider_adapter = adapter_class(adapter_config=unit["config"], thread_name=unit["name"])
+
+        if unit["name"] in saved_states and hasattr(provider_adapter, "load_state"):
+            provider_adapter.load_state(saved_states[unit["name"]])
+
+        adapters[unit["name"]] = provider_adapter
+
+    source_runner = SourceRunner(adapters, engine=engine)
+    source_runner.start()
+
+    def send_state():
+        for unit_name, provider_adapter in adapters.items():
+            if hasattr(provider_adapter, "dump_state"):
+                channel.put(("state", worker_index, unit_name, provider_adapter.dump_state()))
+
+    def send_history():
+        readings = history_store.collect()
+
+        if readings:
+            channel.put(("history", worker_index, readings))
+
+    next_state_at = time.monotonic() + state_interval
+
+    # A message or the end of the pipe (the parent exited) both mean stop
+    while not stop_reader.poll(forward_interval):
+        forwarder.forward()
+        send_history()
+
+        if time.monotonic() >= next_state_at:
+            send_state()
+            next_state_at = time.monotonic() + state_interval
+
+    stopped_in_time = source_runner.stop(timeout=max(0.0, shutdown_timeout - WORKER_STOP_MARGIN))
+
+    forwarder.forward()
+    send_history()
+    send_state()
+    channel.put(("stopped", worker_index))
+
+    if not stopped_in_time:
+        logger.error(f"Worker #{worker_index}: exiting without waiting for the sources which didn't stop")
+        channel.close()
+        channel.join_thread()
+        logging.shutdown()
+        os._exit(1)
+
+
+class WorkerPool():
+    """
+    Runs the sources in worker processes and collects their metrics and state
+    """
+
+    def __init__(self, sources, processes, engine="threads", saved_sources=None, forward_interval=1, state_interval=60, shutdown_timeout=30):
+        self.shutdown_timeout = shutdown_timeout
+
+        context = multiprocessing.get_context("spawn")
+        self.channel = context.Queue()
+        self.stopping = False
+        self.stop_writers = []
+        self.stop_readers = []
+
+        self.lock = threading.Condition()
+        self.sources_state = {}
+        self.stopped_workers = set()
+        self.failed_workers = set()
+
+        saved_sources = saved_sources or {}
+        self.processes = []
+
+        for worker_index, units in plan_units(sources, processes).items():
+            saved_states = {}
+
+            for unit in units:
+                saved_state = saved_sources.get(unit["name"], saved_sources.get(unit["source"]))
+
+                if saved_state is not None:
+                    saved_states[unit["name"]] = saved_state
+                    self.sources_state[unit["name"]] = saved_state
+
+            # One pipe per worker: unlike a shared Event, a worker dying while it waits can't break it for the others
+            stop_reader, stop_writer = context.Pipe(duplex=False)
+            self.stop_readers.append(stop_reader)
+            self.stop_writers.append(stop_writer)
+
+            self.processes.append(context.Process(
+                target=worker_main,
+                args=(worker_index, units, engine, saved_states, self.channel, stop_reader, forward_interval, state_interval, shutdown_timeout),
+                name=f"airquality-worker-{worker_index}",
+            ))
+
+        self.receiver = threading.Thread(target=self._receive, name="WorkerPoolReceiver", daemon=True)
+
+    def start(self):
+        for process, stop_reader in zip(self.processes, self.stop_readers):
+            process.start()
+            stop_reader.close()
+            logger.info(f"Started worker process '{process.name}' (pid {process.pid})")
+
+        self.receiver.start()
+
+    def _receive(self):
+        while len(self.stopped_workers) < len(self.processes):
+            try:
+                message = self.channel.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if message[0] == "metrics":
+                self._apply_metrics(*message[1:])
+
+            elif message[0] == "history":
+                history_store = get_history_store()
+
+                for target_key, capacity, reading in message[2]:
+                    history_store.append(target_key, capacity, reading, owner=("worker", message[1]))
+
+            elif message[0] == "state":
+                _, _, unit_name, unit_state = message
+
+                with self.lock:
+                    self.sources_state[unit_name] = unit_state
+
+            elif message[0] == "stopped":
+                with self.lock:
+                    self.stopped_workers.add(message[1])
+                    self.lock.notify_all()
+
+    @staticmethod
+    def _apply_metrics(worker_index, definitions, updates, removals):
+        metrics = MetricsHandler.get_metrics()
+
+        for metric_name, (metric_type, metric_help) in definitions.items():
+            metric = metrics.get(metric_name)
+
+            if not isinstance(metric, WorkerSeries):
+                metric = WorkerSeries(metric_name, local_metric=metric)
+                metrics[metric_name] = metric
+
+            if metric_type is not None:
+                metric.set_type(metric_type)
+
+            if metric_help is not None:
+                metric.set_help(metric_help)
+
+        for metric_name, labelset_key, labels_formatted, value in updates:
+            metrics[metric_name].update(worker_index, labelset_key, labels_formatted, value)
+
+        for metric_name, labelset_key in removals:
+            metrics[metric_name].remove(worker_index, labelset_key)
+
+    def check(self):
+        for process in self.processes:
+            if process.exitcode is not None and not self.stopping and process.name not in self.failed_workers:
+                self.failed_workers.add(process.name)
+                logger.error(f"Worker process '{process.name}' exited unexpectedly with code {process.exitcode}")
+
+    def _dead_count(self):
+        """
+        :return: number of workers which exited without reporting that they stopped
+        """
+        return sum(1 for worker_index, process in enumerate(self.processes) if process.exitcode is not None and worker_index not in self.stopped_workers)
+
+    def dump_state(self):
+        with self.lock:
+            return dict(self.sources_state)
+
+    def stop(self):
+        """
+        :return: True if every worker stopped within the shutdown timeout, the others are terminated
+        """
+        logger.info(f"Stopping {len(self.processes)} worker processes")
+        self.stopping = True
+
+        deadline = time.monotonic() + self.shutdown_timeout
+
+        for process, stop_writer in zip(self.processes, self.stop_writers):
+            try:
+                stop_writer.send("stop")
+
+            except OSError as e:
+                logger.warning(f"Can't ask worker process '{process.name}' to stop, it's gone ({e.__class__.__name__}): {e}")
+
+        with self.lock:
+            while len(self.stopped_workers) < len(self.processes) - self._dead_count() and time.monotonic() < deadline:
+                self.lock.wait(timeout=min(1.0, max(0.0, deadline - time.monotonic())))
+
+        stopped_in_time = True
+
+        for process in self.processes:
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+
+            if process.is_alive():
+                # Workers ignore SIGTERM, see worker_main
+                logger.error(f"Worker process '{process.name}' didn't stop in time, killing it")
+                process.kill()
+                stopped_in_time = False
+
+            elif process.exitcode != 0:
+                stopped_in_time = False
+
+        return stopped_in_time
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,wrong-import-position
+"""
+
+  IQAir Adapter benchmark
+  =======================
+
+  Polls synthetic (or recorded) targets through the IQAir Adapter against the local
+  API stand-in, and reports the time of one full polling cycle.
+
+  Every target count runs in a fresh interpreter, so CPU time and peak RSS aren't mixed up.
+
+  Usage:
+    python benchmarks/bench_adapter.py
+    python benchmarks/bench_adapter.py --sizes 10,1000 --concurrency 64 --latency 0.02 --error-rate 0.01
+    python benchmarks/bench_adapter.py --replay recorded.jsonl
+    python benchmarks/bench_adapter.py --engine asyncio --concurrency 256
+
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import threading
+import subprocess
+from urllib.request import urlopen
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "airquality"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import stub_server
+
+
+logger = logging.getLogger("bench_adapter")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def load_targets(count, replay_filename=None):
+    if replay_filename is None:
+        return stub_server.synthetic_targets(count)
+
+    recorded = []
+
+    with open(replay_filename, "r", encoding="utf-8") as replay_fh:
+        for line in replay_fh:
+            if line.strip():
+                record = json.loads(line)
+                recorded.append({"country": record["country"], "state": record["state"], "city": record["city"]})
+
+    targets = recorded[:count]
+    targets.extend(stub_server.synthetic_targets(count - len(targets), state="Padding"))
+    return targets
+
+
+def stub_requests(url):
+    with urlopen(url.rstrip("/") + "/stats", timeout=10) as response:
+        return json.loads(response.read())["requests"]
+
+
+def run_single(url, count, concurrency, replay_filename=None, timeout=600, engine="threads"):
+    """
+    Runs one polling cycle in the current process
+
+    :return: benchmark results
+    :rtype: dict
+    """
+    from providers import iqair  # pylint: disable=import-outside-toplevel
+
+    targets = load_targets(count, replay_filename)
+    adapter_class = iqair.AsyncAdapter if engine == "asyncio" else iqair.Adapter
+
+    adapter = adapter_class({
+        "api_key": "benchmark",
+        "api_base_url": url,
+        "api_query_limit_minute": 10**9,
+        "api_query_limit_day": 10**9,
+        "api_query_limit_month": 10**9,
+        "max_concurrency": concurrency,
+        "cache_enabled": False,
+        "target_polling_interval": 0.001,
+        "target_polling_jitter": 0,
+        "targets": targets,
+    }, thread_name="benchmark")
+
+    latencies = {}
+    latencies_lock = threading.Lock()
+    cycle_done = threading.Event()
+    retrieve_data = adapter._retrieve_data  # pylint: disable=protected-access
+
+    def record_latency(target_key, elapsed):
+        with latencies_lock:
+            latencies.setdefault(target_key, elapsed)
+
+            if len(latencies) >= count:
+                cycle_done.set()
+
+    def timed_retrieve_data(country, state, city):
+        started_at = time.perf_counter()
+
+        try:
+            return retrieve_data(country, state, city)
+        finally:
+            record_latency((country, state, city), time.perf_counter() - started_at)
+
+    async def async_timed_retrieve_data(country, state, city):
+        started_at = time.perf_counter()
+
+        try:
+            return await retrieve_data(country, state, city)
+        finally:
+            record_latency((country, state, city), time.perf_counter() - started_at)
+
+    if engine == "asyncio":
+        adapter._retrieve_data = async_timed_retrieve_data  # pylint: disable=protected-access
+        runner = threading.Thread(target=asyncio.run, args=(adapter.run(),), daemon=True)
+    else:
+        adapter._retrieve_data = timed_retrieve_data  # pylint: disable=protected-access
+        adapter.daemon = True
+        runner = adapter
+
+    requests_before = stub_requests(url)
+    cpu_before = time.process_time()
+    started_at = time.perf_counter()
+
+    runner.start()
+    completed = cycle_done.wait(timeout=timeout)
+
+    cycle_seconds = time.perf_counter() - started_at
+    cpu_seconds = time.process_time() - cpu_before
+    os_threads = threading.active_count()
+    adapter.stop()
+
+    requests_made = stub_requests(url) - requests_before - 1
+    latency_values = list(latencies.values())
+
+    return {
+        "engine": engine,
+        "targets": count,
+        "completed": completed,
+        "concurrency": concurrency,
+        "cycle_seconds": round(cycle_seconds, 3),
+        "requests": requests_made,
+        "requests_per_second": round(requests_made / cycle_seconds, 1),
+        "latency_p50_ms": round(percentile(latency_values, 0.50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latency_values, 0.99) * 1000, 2),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "os_threads": os_threads,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="IQAir Adapter benchmark")
+    parser.add_argument("--sizes", default="10,1000,10000", help="comma-separated target counts")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--url", default=None, help="use an already running stand-in instead of starting one")
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--latency-jitter", type=float, default=0.001)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--replay", default=None, help="serve, and poll, the targets recorded in this JSONL file")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    parser.add_argument("--single", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def print_results(results, as_json=False):
+    if as_json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    columns = ["engine", "targets", "cycle_seconds", "requests_per_second", "latency_p50_ms", "latency_p99_ms", "cpu_seconds", "os_threads", "peak_rss_mb"]
+    print("  ".join(f"{column:>20}" for column in columns))
+
+    for result in results:
+        print("  ".join(f"{result[column]:>20}" for column in columns))
+
+
+def main():
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s level=%(levelname)s function=%(name)s.%(funcName)s %(message)s")
+
+    if arguments.single is not None:
+        print(json.dumps(run_single(arguments.url, arguments.single, arguments.concurrency, arguments.replay, engine=arguments.engine)))
+        return
+
+    stub_process = None
+    url = arguments.url
+
+    if url is None:
+        stub_port = 18000 + os.getpid() % 1000
+        stub_command = [
+            sys.executable, os.path.join(BENCHMARKS_DIR, "stub_server.py"),
+            "--port", str(stub_port),
+            "--latency", str(arguments.latency),
+            "--latency-jitter", str(arguments.latency_jitter),
+            "--error-rate", str(arguments.error_rate),
+            "--rate-limit-rate", str(arguments.rate_limit_rate),
+        ]
+
+        if arguments.replay is not None:
+            stub_command.extend(["--replay", arguments.replay])
+
+        stub_process = subprocess.Popen(stub_command, stderr=subprocess.DEVNULL)  # pylint: disable=consider-using-with
+        url = f"http://127.0.0.1:{stub_port}/"
+
+        for _ in range(50):
+            try:
+                stub_requests(url)
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    results = []
+
+    try:
+        for size in [int(size) for size in arguments.sizes.split(",")]:
+            command = [sys.executable, os.path.abspath(__file__), "--single", str(size), "--url", url, "--concurrency", str(arguments.concurrency), "--engine", arguments.engine]
+
+            if arguments.replay is not None:
+                command.extend(["--replay", arguments.replay])
+
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    finally:
+        if stub_process is not None:
+            stub_process.terminate()
+            stub_process.wait()
+
+    print_results(results, as_json=arguments.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,wrong-import-position,protected-access
+"""
+
+  Ingest micro-benchmark
+  ======================
+
+  Measures the CPU time the IQAir Adapter spends on a response once it arrived:
+  decoding the body, then updating the metrics, the freshness cache and the history.
+  No requests are sent; the payloads are generated like the stand-in's, or recorded
+  by it (a new hourly reading of every target in turn).
+
+  Usage:
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --payloads 100000 --targets 1000 --log-level DEBUG
+    python benchmarks/bench_ingest.py --replay recorded.jsonl --json
+
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "airquality"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import stub_server
+
+
+def load_payloads(payload_count, target_count, replay_filename=None):
+    """
+    :return: list of (country, state, city, response body)
+    """
+    if replay_filename is None:
+        targets = stub_server.synthetic_targets(target_count)
+        started_at = time.time()
+        payloads = []
+
+        for position in range(payload_count):
+            country, state, city = targets[position % target_count].values()
+            payload = stub_server.synthetic_payload(country, state, city, now=started_at + position // target_count * 3600)
+            payloads.append((country, state, city, json.dumps(payload).encode("utf-8")))
+
+        return payloads
+
+    recorded = []
+
+    with open(replay_filename, "r", encoding="utf-8") as replay_fh:
+        for line in replay_fh:
+            if line.strip():
+                record = json.loads(line)
+
+                if record["status"] == 200:
+                    recorded.append((record["country"], record["state"], record["city"], record["body"].encode("utf-8")))
+
+    return [recorded[position % len(recorded)] for position in range(payload_count)]
+
+
+def run(payloads, log_level="INFO"):
+    """
+    Ingests the payloads through one adapter
+
+    :return: benchmark results
+    :rtype: dict
+    """
+    from providers import iqair  # pylint: disable=import-outside-toplevel
+
+    targets = sorted({(country, state, city) for country, state, city, _ in payloads})
+    adapter = iqair.Adapter({
+        "api_key": "benchmark",
+        "targets": [{"country": country, "state": state, "city": city} for country, state, city in targets],
+    }, thread_name="benchmark")
+
+    logging.getLogger("providers").setLevel(getattr(logging, log_level.upper()))
+
+    decode_seconds = 0.0
+    process_seconds = 0.0
+    started_at = time.perf_counter()
+
+    for country, state, city, body in payloads:
+        decode_started_at = time.process_time()
+        data = adapter._decode_payload(body)
+        process_started_at = time.process_time()
+        adapter._process_payload(country, state, city, data)
+        process_finished_at = time.process_time()
+
+        decode_seconds += process_started_at - decode_started_at
+        process_seconds += process_finished_at - process_started_at
+
+    return {
+        "payloads": len(payloads),
+        "targets": len(targets),
+        "log_level": log_level.upper(),
+        "wall_seconds": round(time.perf_counter() - started_at, 3),
+        "decode_us": round(decode_seconds / len(payloads) * 1e6, 2),
+        "process_us": round(process_seconds / len(payloads) * 1e6, 2),
+        "cpu_us_per_response": round((decode_seconds + process_seconds) / len(payloads) * 1e6, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="IQAir Adapter ingest micro-benchmark")
+    parser.add_argument("--payloads", type=int, default=100000, help="number of responses to ingest")
+    parser.add_argument("--targets", type=int, default=1000, help="number of targets of the generated payloads")
+    parser.add_argument("--log-level", default="INFO", help="log level of the providers while ingesting")
+    parser.add_argument("--replay", default=None, help="ingest the responses recorded in this JSONL file")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s level=%(levelname)s function=%(name)s.%(funcName)s %(message)s")
+
+    result = run(load_payloads(arguments.payloads, arguments.targets, arguments.replay), log_level=arguments.log_level)
+
+    if arguments.json:
+        print(json.dumps(result))
+        return
+
+    for column, value in result.items():
+        print(f"{column:>20}  {value}")
+
+
+if __name__ == "__main__":
+    main()
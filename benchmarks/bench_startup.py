@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation,import-outside-toplevel
+"""
+
+  Startup benchmark
+  =================
+
+  Measures, in fresh interpreters, how long it takes to discover the providers
+  and to load the ones the configured sources use, along with the number of
+  imported modules and peak RSS.
+
+  Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --providers iqair --runs 20 --json
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+AIRQUALITY_DIR = os.path.join(BENCHMARKS_DIR, "..", "airquality")
+
+
+def run_single(provider_names):
+    """
+    Discovers and loads providers in the current process
+
+    :return: benchmark results
+    :rtype: dict
+    """
+    started_at = time.perf_counter()
+    modules_before = len(sys.modules)
+
+    sys.path.insert(0, AIRQUALITY_DIR)
+    from providers import providers
+
+    known_providers = providers.names()
+    discovered_at = time.perf_counter()
+
+    for provider_name in provider_names:
+        providers.get(provider_name)
+
+    loaded_at = time.perf_counter()
+
+    return {
+        "providers": ",".join(provider_names) or "-",
+        "known_providers": len(known_providers),
+        "discovery_ms": (discovered_at - started_at) * 1000,
+        "load_ms": (loaded_at - discovered_at) * 1000,
+        "total_ms": (loaded_at - started_at) * 1000,
+        "modules_imported": len(sys.modules) - modules_before,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Provider discovery and loading benchmark")
+    parser.add_argument("--providers", default="iqair", help="comma-separated providers to load, empty for none")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters per measurement")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def measure(provider_names, runs):
+    samples = []
+
+    for _ in range(runs):
+        command = [sys.executable, os.path.abspath(__file__), "--single", "--providers", ",".join(provider_names)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    result = dict(samples[0])
+
+    for column in ("discovery_ms", "load_ms", "total_ms", "peak_rss_mb"):
+        result[column] = round(statistics.median(sample[column] for sample in samples), 2)
+
+    result["runs"] = runs
+    return result
+
+
+def main():
+    arguments = parse_arguments()
+    provider_names = [name for name in arguments.providers.split(",") if name]
+
+    if arguments.single:
+        print(json.dumps(run_single(provider_names)))
+        return
+
+    results = [measure([], arguments.runs)]
+
+    if provider_names:
+        results.append(measure(provider_names, arguments.runs))
+
+    if arguments.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    columns = ["providers", "known_providers", "discovery_ms", "load_ms", "total_ms", "modules_imported", "peak_rss_mb"]
+    print("  ".join(f"{column:>16}" for column in columns))
+
+    for result in results:
+        print("  ".join(f"{result[column]:>16}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=too-many-locals, broad-except, too-many-arguments, raise-missing-from
+# pylint: disable=import-error,f-string-without-interpolation
+"""
+
+  IQAir API stand-in
+  ==================
+
+  Serves the /v2/city endpoint locally for benchmarks, without spending real quota.
+
+  Synthetic mode (default) answers for any city with a generated payload.
+  Record mode proxies requests to the real API and appends every response to a JSONL file.
+  Replay mode serves the responses from such a file.
+
+  Usage:
+    python benchmarks/stub_server.py --port 18080 --latency 0.05 --error-rate 0.01 --rate-limit-rate 0.01
+    python benchmarks/stub_server.py --record recorded.jsonl --upstream https://api.airvisual.com/
+    python benchmarks/stub_server.py --replay recorded.jsonl
+
+"""
+
+import argparse
+import datetime
+import hashlib
+import logging
+import random
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urljoin
+from urllib.request import urlopen
+from urllib.error import HTTPError
+
+
+logger = logging.getLogger("stub_server")
+
+
+def synthetic_city_name(index):
+    return f"City{index:06d}"
+
+
+def synthetic_targets(count, country="Benchland", state="Synthetic"):
+    return [{"country": country, "state": state, "city": synthetic_city_name(index)} for index in range(count)]
+
+
+def stable_hash(country, state, city):
+    return int(hashlib.md5(f"{country}|{state}|{city}".encode("utf-8")).hexdigest()[:8], 16)
+
+
+def synthetic_payload(country, state, city, now=None):
+    if now is None:
+        now = time.time()
+
+    seed = stable_hash(country, state, city)
+    hour_ts = datetime.datetime.fromtimestamp(int(now) // 3600 * 3600, tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    return {
+        "status": "success",
+        "data": {
+            "city": city,
+            "state": state,
+            "country": country,
+            "location": {
+                "type": "Point",
+                "coordinates": [seed % 360 - 180, seed % 180 - 90],
+            },
+            "current": {
+                "pollution": {
+                    "ts": hour_ts,
+                    "aqius": seed % 300,
+                    "mainus": "p2",
+                    "aqicn": seed % 200,
+                    "maincn": "p2",
+                },
+                "weather": {
+                    "ts": hour_ts,
+                    "tp": seed % 40 - 10,
+                    "pr": 980 + seed % 60,
+                    "hu": seed % 100,
+                    "ws": round(seed % 150 / 10, 2),
+                    "wd": seed % 360,
+                    "ic": "01d",
+                },
+            },
+        },
+    }
+
+
+class StubState():
+    """
+    Behaviour settings and counters of the stand-in
+    """
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 cities=None, replay_filename=None, record_filename=None, upstream=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.cities = cities
+
+        self.upstream = upstream
+        self.record_filename = record_filename
+        self.record_lock = threading.Lock()
+
+        self.recorded = {}
+        self.recorded_list = []
+
+        if replay_filename is not None:
+            self._load_replay(replay_filename)
+
+        self.counters_lock = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def _load_replay(self, filename):
+        with open(filename, "r", encoding="utf-8") as replay_fh:
+            for line in replay_fh:
+                if not line.strip():
+                    continue
+
+                record = json.loads(line)
+                key = (record["country"], record["state"], record["city"])
+                self.recorded[key] = record
+                self.recorded_list.append(record)
+
+        logger.info(f"Loaded {len(self.recorded_list)} recorded responses from {filename}")
+
+    def count(self, name):
+        with self.counters_lock:
+            self.counters[name] += 1
+
+    def record(self, country, state, city, status, body):
+        with self.record_lock:
+            with open(self.record_filename, "a", encoding="utf-8") as record_fh:
+                record_fh.write(json.dumps({"country": country, "state": state, "city": city, "status": status, "body": body}, separators=(",", ":")) + "\n")
+
+    def respond(self, country, state, city, query):
+        """
+        :return: (status code, body bytes)
+        """
+        if self.upstream is not None:
+            return self._proxy(country, state, city, query)
+
+        if self.recorded_list:
+            record = self.recorded.get((country, state, city))
+
+            if record is None:
+                record = self.recorded_list[stable_hash(country, state, city) % len(self.recorded_list)]
+
+            return record["status"], record["body"].encode("utf-8")
+
+        if self.cities is not None and not self._is_known_city(city):
+            return 400, json.dumps({"status": "fail", "data": {"message": "city_not_found"}}).encode("utf-8")
+
+        return 200, json.dumps(synthetic_payload(country, state, city)).encode("utf-8")
+
+    def _is_known_city(self, city):
+        return city.startswith("City") and city[4:].isdigit() and int(city[4:]) < self.cities
+
+    def _proxy(self, country, state, city, query):
+        url = urljoin(self.upstream, "/v2/city") + "?" + query
+
+        try:
+            with urlopen(url, timeout=30) as response:
+                status, body = response.status, response.read().decode("utf-8")
+
+        except HTTPError as e:
+            status, body = e.code, e.read().decode("utf-8")
+
+        if self.record_filename is not None:
+            self.record(country, state, city, status, body)
+
+        return status, body.encode("utf-8")
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles /v2/city requests
+    """
+
+    protocol_version = "HTTP/1.1"
+    stub = None
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        stub = self.stub
+        stub.count("requests")
+        parsed_url = urlparse(self.path)
+
+        if parsed_url.path == "/stats":
+            with stub.counters_lock:
+                self._send(200, json.dumps(stub.counters).encode("utf-8"))
+            return
+
+        if not parsed_url.path.rstrip("/").endswith("/city"):
+            self._send(404, b'{"status":"fail","data":{"message":"not_found"}}')
+            return
+
+        if stub.latency or stub.latency_jitter:
+            time.sleep(max(0.0, random.gauss(stub.latency, stub.latency_jitter)))
+
+        dice = random.random()
+
+        if dice < stub.rate_limit_rate:
+            stub.count("rate_limited")
+            self._send(429, b'{"status":"fail","data":{"message":"call_limit_reached"}}')
+            return
+
+        if dice < stub.rate_limit_rate + stub.error_rate:
+            stub.count("errors")
+            self._send(500, b'{"status":"fail","data":{"message":"internal_error"}}')
+            return
+
+        query = parse_qs(parsed_url.query)
+
+        try:
+            country, state, city = query["country"][0], query["state"][0], query["city"][0]
+        except KeyError:
+            self._send(400, b'{"status":"fail","data":{"message":"missing_parameters"}}')
+            return
+
+        status, body = stub.respond(country, state, city, parsed_url.query)
+        self._send(status, body)
+
+
+def start(listen_address="127.0.0.1", listen_port=0, **stub_kwargs):
+    """
+    Starts the stand-in in a background thread
+
+    :return: HTTP server, its base URL is http://<server_address>/
+    """
+    handler = type("BoundStubRequestHandler", (StubRequestHandler,), {"stub": StubState(**stub_kwargs)})
+    server = ThreadingHTTPServer((listen_address, listen_port), handler)
+    server.daemon_threads = True
+
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    return server
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Local IQAir API stand-in")
+    parser.add_argument("--listen-address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response latency, seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="standard deviation of the latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--cities", type=int, default=None, help="number of known synthetic cities (default: any)")
+    parser.add_argument("--replay", default=None, help="serve responses recorded in this JSONL file")
+    parser.add_argument("--record", default=None, help="append upstream responses to this JSONL file")
+    parser.add_argument("--upstream", default=None, help="proxy requests to this API base URL")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s level=%(levelname)s function=%(name)s.%(funcName)s %(message)s")
+
+    if arguments.record is not None and arguments.upstream is None:
+        raise SystemExit("--record requires --upstream")
+
+    server = start(
+        listen_address=arguments.listen_address,
+        listen_port=arguments.port,
+        latency=arguments.latency,
+        latency_jitter=arguments.latency_jitter,
+        error_rate=arguments.error_rate,
+        rate_limit_rate=arguments.rate_limit_rate,
+        cities=arguments.cities,
+        replay_filename=arguments.replay,
+        record_filename=arguments.record,
+        upstream=arguments.upstream,
+    )
+    logger.info(f"IQAir API stand-in listening on http://{server.server_address[0]}:{server.server_address[1]}/")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Freshness cache tests
+  API timestamps are UTC whatever the time zone of the host, and the next poll
+  is due once the upstream is expected to publish newer data.
+
+"""
+
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+import pytest
+
+from providers.iqair.base import _parse_ts
+from providers.iqair.cache import FreshnessCache
+
+
+@pytest.fixture(params=["UTC", "America/New_York", "Asia/Tokyo"])
+def host_timezone(request):
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = request.param
+    time.tzset()
+    _parse_ts.cache_clear()
+
+    yield request.param
+
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+
+    time.tzset()
+    _parse_ts.cache_clear()
+
+
+@pytest.mark.parametrize("ts", ["2025-02-07T07:00:00.000Z", "2025-02-07T07:00:00Z", "2025-02-07T07:00:00"])
+def test_timestamps_are_utc(host_timezone, ts):  # pylint: disable=unused-argument,redefined-outer-name
+    assert _parse_ts(ts) == 1738911600
+
+
+def test_next_poll_is_due_after_the_upstream_update(host_timezone):  # pylint: disable=unused-argument,redefined-outer-name
+    cache = FreshnessCache(update_interval=3600, grace_period=300, recheck_interval=600)
+    fetched_at = _parse_ts("2025-02-07T07:06:00.000Z")
+
+    assert cache.store("target", {}, _parse_ts("2025-02-07T07:00:00.000Z"), _parse_ts("2025-02-07T07:00:00.000Z"), now=fetched_at)
+    assert cache.next_due("target") - fetched_at == 3600 + 300 - 6 * 60
+    assert not cache.is_due("target", now=fetched_at + 60)
+
+
+def test_unchanged_data_is_rechecked():
+    cache = FreshnessCache(update_interval=3600, grace_period=300, recheck_interval=600)
+
+    assert cache.store("target", {}, 1000, 1000, now=5000)
+    assert not cache.store("target", {}, 1000, 1000, now=6000)
+    assert cache.next_due("target") == 6600
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Circuit breaker tests
+  Failures in a row open the circuit, a probe is let through after the reset timeout,
+  and its result closes the circuit or opens it again.
+
+"""
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from providers.iqair.circuit import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def open_circuit(endpoint, now):
+    circuit = CircuitBreaker(endpoint, failure_threshold=3, reset_timeout=60)
+
+    for _ in range(3):
+        assert circuit.allow(now=now)
+        circuit.record_failure(now=now)
+
+    return circuit
+
+
+def test_failures_in_a_row_open_the_circuit():
+    circuit = CircuitBreaker("test-circuit-threshold", failure_threshold=3, reset_timeout=60)
+
+    circuit.record_failure(now=100)
+    circuit.record_failure(now=100)
+    circuit.record_success()
+    circuit.record_failure(now=100)
+    circuit.record_failure(now=100)
+    assert circuit.state == CLOSED
+
+    circuit.record_failure(now=100)
+    assert circuit.state == OPEN
+    assert not circuit.allow(now=130)
+    assert circuit.retry_in(now=130) == 30
+
+
+def test_successful_probe_closes_the_circuit():
+    circuit = open_circuit("test-circuit-probe-success", now=100)
+
+    assert circuit.allow(now=160)
+    assert circuit.state == HALF_OPEN
+    assert not circuit.allow(now=161)
+
+    circuit.record_success()
+
+    assert circuit.state == CLOSED
+    assert circuit.allow(now=162)
+
+
+def test_failed_probe_opens_the_circuit_again():
+    circuit = open_circuit("test-circuit-probe-failure", now=100)
+
+    assert circuit.allow(now=160)
+    circuit.record_failure(now=160)
+
+    assert circuit.state == OPEN
+    assert not circuit.allow(now=200)
+    assert circuit.allow(now=220)
+
+
+def test_lost_probe_is_replaced_after_the_reset_timeout():
+    circuit = open_circuit("test-circuit-probe-lost", now=100)
+
+    assert circuit.allow(now=160)
+    assert not circuit.allow(now=200)
+    assert circuit.allow(now=220)
+    assert circuit.state == HALF_OPEN
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Request coalescing tests
+  Fetches of the same key share one flight, a stopped caller doesn't wait for another one's fetch,
+  and cancelling the leader of an async flight leaves its waiters a result.
+
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from providers.iqair.coalescer import SingleFlight, AsyncSingleFlight, IN_FLIGHT, RECENT
+
+
+def test_concurrent_fetches_share_one_flight():
+    single_flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"aqius": 10}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("key", fetch, owner="a")))
+    leader.start()
+    time.sleep(0.1)
+    waiter = threading.Thread(target=lambda: results.append(single_flight.do("key", fetch, owner="b")))
+    waiter.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=str) == sorted([({"aqius": 10}, None), ({"aqius": 10}, IN_FLIGHT)], key=str)
+
+
+def test_recent_result_is_shared_only_with_other_owners():
+    single_flight = SingleFlight()
+    single_flight.do("key", lambda: {"aqius": 10}, window=30, owner="a")
+
+    assert single_flight.do("key", lambda: {"aqius": 20}, window=30, owner="a") == ({"aqius": 10}, None)
+    assert single_flight.do("key", lambda: {"aqius": 20}, window=30, owner="b") == ({"aqius": 10}, RECENT)
+
+
+def test_failed_flight_is_not_reused():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError("upstream failed")
+
+    try:
+        single_flight.do("key", fail, window=30)
+    except ValueError:
+        pass
+
+    assert single_flight.do("key", lambda: {"aqius": 10}, window=30) == ({"aqius": 10}, None)
+
+
+def test_stopped_waiter_gives_up():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=single_flight.do, args=("key", lambda: release.wait(5)))
+    leader.start()
+    time.sleep(0.1)
+
+    stop_event = threading.Event()
+    stop_event.set()
+    started_at = time.monotonic()
+
+    assert single_flight.do("key", lambda: True, stop_event=stop_event) == (False, None)
+    assert time.monotonic() - started_at < 2
+
+    release.set()
+    leader.join(5)
+
+
+def test_waiters_lead_again_when_the_leader_is_cancelled():
+    async def scenario():
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return {"aqius": len(calls)}
+
+        leader = asyncio.create_task(single_flight.do("key", fetch, owner="a"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(single_flight.do("key", fetch, owner="b"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        return await waiter, leader.cancelled(), len(calls)
+
+    assert asyncio.run(scenario()) == (({"aqius": 2}, None), True, 2)
+
+
+def test_cancelled_waiter_leaves_the_flight_running():
+    async def scenario():
+        single_flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.1)
+            return {"aqius": 10}
+
+        leader = asyncio.create_task(single_flight.do("key", fetch, owner="a"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(single_flight.do("key", fetch, owner="b"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+
+        return await leader
+
+    assert asyncio.run(scenario()) == ({"aqius": 10}, None)
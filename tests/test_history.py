@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  History tests
+  The ring buffer keeps the latest readings in order once it wraps around,
+  and sources sharing a target share one buffer of the largest size they keep.
+
+"""
+
+import os
+import sys
+import math
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from providers.iqair.history import HistoryBuffer, HistoryStore, FIELDS
+
+VALUES = (10, 5, 1.5, 1013, 60, 2.5, 90)
+
+
+def reading(ts):
+    return (ts, ts) + VALUES
+
+
+def test_buffer_wraps_around_keeping_the_latest_readings_in_order():
+    history_buffer = HistoryBuffer(3)
+
+    for ts in range(1, 6):
+        history_buffer.append(reading(ts))
+
+    assert [stored[0] for stored in history_buffer.readings()] == [3, 4, 5]
+    assert history_buffer.last()[0] == 5
+    assert [stored[0] for stored in history_buffer.readings(since=4)] == [4, 5]
+
+
+def test_resized_buffer_keeps_the_latest_readings():
+    history_buffer = HistoryBuffer(4)
+
+    for ts in range(1, 5):
+        history_buffer.append(reading(ts))
+
+    assert [stored[0] for stored in history_buffer.resize(2).readings()] == [3, 4]
+    assert [stored[0] for stored in history_buffer.resize(8).readings()] == [1, 2, 3, 4]
+
+
+def test_store_skips_readings_which_did_not_advance_and_keeps_missing_values():
+    history_store = HistoryStore()
+
+    assert history_store.record("target", 4, 100, 100, (10, None, 1.5, 1013, 60, 2.5, 90))
+    assert not history_store.record("target", 4, 100, 100, VALUES)
+
+    readings = history_store.query("target")
+    assert len(readings) == 1
+    assert dict(zip(FIELDS, readings[0]))["aqicn"] is None
+    assert math.isclose(dict(zip(FIELDS, readings[0]))["tp"], 1.5)
+
+
+def test_sources_sharing_a_target_keep_the_largest_history():
+    history_store = HistoryStore()
+
+    for ts in range(1, 11):
+        history_store.record("target", 8, ts, ts, VALUES, owner="long")
+        history_store.record("target", 2, ts, ts, VALUES, owner="short")
+
+    assert [stored[0] for stored in history_store.query("target")] == list(range(3, 11))
+    assert history_store.buffers["target"].capacity == 8
+
+
+def test_unknown_target_has_no_history():
+    assert HistoryStore().query("unknown") is None
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Quota budget planner tests
+  Rates are split by weight and capped at what a target asks for, intervals stretch
+  to make the budget last, and a target without budget waits for the window to reset.
+
+"""
+
+import os
+import sys
+import math
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from providers.iqair.planner import BudgetPlanner, allocate_rates
+from providers.iqair.quota import Quota
+
+NOW = 1738911600
+
+
+def target(city, polling_interval=3600, weight=1):
+    return {"country": "C", "state": "S", "city": city, "polling_interval": polling_interval, "weight": weight}
+
+
+def test_rates_are_split_by_weight():
+    rates = allocate_rates(3.0, {"a": (2, 10.0), "b": (1, 10.0)})
+
+    assert math.isclose(rates["a"], 2.0)
+    assert math.isclose(rates["b"], 1.0)
+
+
+def test_capped_target_leaves_its_share_to_the_others():
+    rates = allocate_rates(3.0, {"a": (1, 0.5), "b": (1, 10.0), "c": (1, 10.0)})
+
+    assert math.isclose(rates["a"], 0.5)
+    assert math.isclose(rates["b"], 1.25)
+    assert math.isclose(rates["c"], 1.25)
+
+
+def test_no_budget_allocates_nothing():
+    assert allocate_rates(0.0, {"a": (1, 1.0)}) == {"a": 0.0}
+
+
+def test_enough_budget_keeps_the_configured_intervals():
+    quota = Quota("test-key-planner-enough", 100, 10000, 100000)
+    planner = BudgetPlanner("enough", quota, [target("a"), target("b", polling_interval=600)])
+
+    assert planner.interval(("C", "S", "a"), now=NOW) == 3600
+    assert planner.interval(("C", "S", "b"), now=NOW) == 600
+
+
+def test_short_budget_stretches_the_intervals():
+    quota = Quota("test-key-planner-short", 100, 10, 100000)
+    planner = BudgetPlanner("short", quota, [target(city, polling_interval=60) for city in "abcd"])
+    seconds_left = quota.snapshot(NOW)["day"]["reset_at"] - NOW
+
+    assert math.isclose(planner.interval(("C", "S", "a"), now=NOW), seconds_left / 10 * 4, rel_tol=1e-6)
+
+
+def test_target_without_budget_waits_for_the_window_reset():
+    quota = Quota("test-key-planner-exhausted", 100, 10, 100000)
+    quota.exhaust("day", now=NOW)
+    planner = BudgetPlanner("exhausted", quota, [target("a", polling_interval=60)])
+
+    assert planner.interval(("C", "S", "a"), now=NOW) == quota.snapshot(NOW)["day"]["reset_at"] - NOW
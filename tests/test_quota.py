@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Usage quota tests
+  Limits declared for a shared API key, calendar windows and exhausted windows.
+
+"""
+
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from providers.iqair.quota import Quota, get_quota
+
+
+def limits(quota):
+    return {window.name: window.limit for window in quota.windows.values()}
+
+
+def test_strictest_declared_limits_win():
+    quota = Quota("test-key-strictest", 10, 500, 10000)
+    quota.declare_limits("a", 10, 500, 10000)
+    quota.declare_limits("b", 5, 1000, 10000)
+
+    assert limits(quota) == {"minute": 5, "day": 500, "month": 10000}
+
+
+def test_reloaded_limits_apply_in_both_directions():
+    quota = get_quota("test-key-reloaded", 10, 500, 10000, owner="main")
+    assert get_quota("test-key-reloaded", 10, 5000, 10000, owner="main") is quota
+    assert limits(quota)["day"] == 5000
+
+    get_quota("test-key-reloaded", 10, 50, 10000, owner="main")
+    assert limits(quota)["day"] == 50
+
+
+def test_released_owner_stops_restricting_the_key():
+    quota = Quota("test-key-released", 10, 500, 10000)
+    quota.declare_limits("a", 10, 500, 10000)
+    quota.declare_limits("b", 10, 100, 10000)
+    quota.set_share("b", 1)
+
+    quota.release("b")
+
+    assert limits(quota)["day"] == 500
+    assert "b" not in quota.shares
+
+
+def test_minute_window_blocks_until_it_resets():
+    quota = Quota("test-key-minute", 2, 500, 10000)
+    now = 60 * 1000 + 15
+
+    assert quota.acquire(now=now) == (0.0, None)
+    assert quota.acquire(now=now + 1) == (0.0, None)
+    assert quota.acquire(now=now + 2) == (43.0, "minute")
+    assert quota.acquire(now=now + 45) == (0.0, None)
+    assert quota.snapshot(now=now + 45)["minute"]["count"] == 1
+    assert quota.snapshot(now=now + 45)["day"]["count"] == 3
+
+
+def test_day_window_resets_at_local_midnight():
+    quota = Quota("test-key-day", 100, 2, 10000)
+    noon = time.mktime((2025, 2, 7, 12, 0, 0, 0, 0, -1))
+    midnight = time.mktime((2025, 2, 8, 0, 0, 0, 0, 0, -1))
+
+    quota.acquire(now=noon)
+    quota.acquire(now=noon + 60)
+
+    assert quota.acquire(now=noon + 120) == (midnight - noon - 120, "day")
+    assert quota.acquire(now=midnight) == (0.0, None)
+
+
+def test_exhausted_minute_window_waits_for_the_next_minute():
+    quota = Quota("test-key-exhausted", 5, 500, 10000)
+    now = 60 * 1000 + 50
+
+    quota.acquire(now=now)
+    quota.exhaust("minute", now=now)
+
+    assert quota.acquire(now=now + 1) == (9.0, "minute")
+    assert quota.wait_time(now=now + 1) == 9.0
+    assert quota.acquire(now=now + 10) == (0.0, None)
+
+
+def test_resting_key_grants_no_slots():
+    quota = Quota("test-key-resting", 5, 500, 10000)
+    now = 60 * 1000
+
+    quota.rest(600, "status_401", now=now)
+
+    assert quota.acquire(now=now + 100) == (500, "rest")
+    assert quota.headroom(now=now + 100) == -1.0
+    assert quota.acquire(now=now + 600) == (0.0, None)
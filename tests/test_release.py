@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Source removal tests
+  A source removed for good drops its series, the series of the targets no other source polls,
+  and its share of the API keys.
+
+"""
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from pyp8s import MetricsHandler
+
+from providers.iqair import Adapter
+from providers.iqair.quota import get_quota
+from providers.iqair.series import SeriesRegistry
+
+
+def build_adapter(name, cities):
+    return Adapter({
+        "api_key": "test-key-release-0123",
+        "api_query_limit_day": 100,
+        "targets": [{"country": "Release", "state": "S", "city": city} for city in cities],
+    }, thread_name=name)
+
+
+def aqius_cities():
+    metric = MetricsHandler.get_metrics()["airquality_aqius"]
+    return sorted(labelset["labels"]["city"] for labelset in metric.data.values() if labelset["labels"].get("country") == "Release")
+
+
+def test_forgotten_source_keeps_the_series_of_targets_other_sources_poll():
+    registry = SeriesRegistry()
+    registry.record("a", ("Release", "S", "Alone"), 3600, True, now=1000)
+    registry.record("a", ("Release", "S", "Shared"), 3600, True, now=1000)
+    registry.record("b", ("Release", "S", "Shared"), 3600, True, now=1000)
+
+    MetricsHandler.init("airquality_aqius", "gauge", "AQI value based on US EPA standard")
+
+    for city in ("Alone", "Shared"):
+        MetricsHandler.set("airquality_aqius", 10, provider="IQAir", country="Release", state="S", city=city)
+
+    registry.forget_source("a")
+
+    assert aqius_cities() == ["Shared"]
+    assert "a" not in registry.entries
+
+
+def test_released_source_drops_its_series_and_its_limits():
+    adapter = build_adapter("test_release_removed", ["X"])
+    kept_adapter = build_adapter("test_release_kept", ["Y"])
+    get_quota("test-key-release-0123", 5, 50, 10000, owner=adapter.name)
+
+    MetricsHandler.set("airquality_iqair_targets_owned", 1, source=adapter.name, replica=0)
+    MetricsHandler.set("airquality_iqair_targets_owned", 1, source=kept_adapter.name, replica=0)
+    adapter.phase_histogram.observe(0.1, provider="IQAir", source=adapter.name, phase="connect")
+
+    adapter.release()
+
+    sources = [labelset["labels"]["source"] for labelset in MetricsHandler.get_metrics()["airquality_iqair_targets_owned"].data.values()]
+    quota = get_quota("test-key-release-0123", 5, 100, 10000)
+
+    assert adapter.name not in sources
+    assert kept_adapter.name in sources
+    assert all(dict(labelset)["source"] != adapter.name for labelset in adapter.phase_histogram.data)
+    assert quota.windows["day"].limit == 100
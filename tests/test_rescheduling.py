@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position,protected-access,consider-using-with
+"""
+
+  Rescheduling tests
+  A target whose next poll can't be planned is polled again after the retry interval
+  instead of dropping out of the schedule.
+
+"""
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import Future
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+from providers.iqair import Adapter
+
+
+def build_adapter(cities, thread_name):
+    return Adapter({
+        "api_key": "test-key-0123456789",
+        "target_retry_interval": 300,
+        "targets": [{"country": "C", "state": "S", "city": city} for city in cities],
+    }, thread_name=thread_name)
+
+
+def failing_interval(target_key, now=None):
+    raise KeyError(target_key)
+
+
+def test_failed_planning_falls_back_to_the_retry_interval():
+    adapter = build_adapter(["X"], "test_rescheduling_fallback")
+    adapter._initial_due_times()
+    adapter.planner.interval = failing_interval
+
+    due_at = adapter._next_due(adapter.targets[0], True)
+
+    assert abs(due_at - (time.time() + 300)) < 5
+
+
+def test_target_stays_scheduled_when_planning_fails():
+    adapter = build_adapter(["X"], "test_rescheduling_callback")
+    adapter._initial_due_times()
+    adapter.planner.interval = failing_interval
+
+    future = Future()
+    future.set_result(True)
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    adapter._reschedule_target(adapter.targets[0], slots, future)
+
+    assert len(adapter.scheduler) == 1
+
+
+def test_added_targets_are_planned_before_they_are_published():
+    adapter = build_adapter(["X"], "test_rescheduling_reconfigure")
+    adapter._initial_due_times()
+    published = []
+    update_targets = adapter.planner.set_targets
+
+    def set_targets(targets):
+        published.append(adapter.target_keys)
+        update_targets(targets)
+
+    adapter.planner.set_targets = set_targets
+    adapter._update_targets(adapter.targets + adapter._parse_targets([{"country": "C", "state": "S", "city": "Y"}]))
+
+    assert published == [frozenset({("C", "S", "X")})]
+    assert adapter.planner.interval(("C", "S", "Y")) > 0
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  Target sharding tests
+  Rendezvous hashing splits the targets into disjoint shards covering all of them,
+  and changing the number of shards moves only the targets the changed shard wins or owned.
+
+"""
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+import pytest
+
+from providers.sharding import rendezvous_owner, select_shard
+
+
+TARGETS = [{"country": "Country", "state": f"State {state}", "city": f"City {city}"} for state in range(20) for city in range(50)]
+
+
+def target_hash_key(target):
+    return "|".join((target["country"], target["state"], target["city"]))
+
+
+def owners(shard_count, salt="shard"):
+    return {target_hash_key(target): rendezvous_owner(target_hash_key(target), shard_count, salt) for target in TARGETS}
+
+
+@pytest.mark.parametrize("shard_count", [1, 2, 3, 4, 5, 8])
+def test_shards_are_disjoint_and_cover_every_target(shard_count):
+    shards = [select_shard(TARGETS, target_hash_key, shard_index, shard_count, salt="shard") for shard_index in range(shard_count)]
+    shard_keys = [{target_hash_key(target) for target in shard} for shard in shards]
+
+    assert sum(len(shard) for shard in shards) == len(TARGETS)
+    assert set().union(*shard_keys) == {target_hash_key(target) for target in TARGETS}
+
+    for shard in shards:
+        assert len(shard) > len(TARGETS) / shard_count / 2
+
+
+@pytest.mark.parametrize("shard_count", [1, 2, 3, 4, 7])
+def test_adding_a_shard_moves_only_the_targets_it_wins(shard_count):
+    before = owners(shard_count)
+    after = owners(shard_count + 1)
+    moved = [key for key in before if before[key] != after[key]]
+
+    assert all(after[key] == shard_count for key in moved)
+    assert len(moved) == sum(1 for owner in after.values() if owner == shard_count)
+    assert len(moved) < 1.5 * len(TARGETS) / (shard_count + 1)
+
+
+@pytest.mark.parametrize("shard_count", [2, 3, 4, 8])
+def test_removing_a_shard_moves_only_the_targets_it_owned(shard_count):
+    before = owners(shard_count)
+    after = owners(shard_count - 1)
+    moved = [key for key in before if before[key] != after[key]]
+
+    assert sorted(moved) == sorted(key for key, owner in before.items() if owner == shard_count - 1)
+
+
+def test_salts_split_independently():
+    replicas = owners(4, salt="replica")
+    shards = owners(4, salt="shard")
+
+    for replica_index in range(4):
+        replica_shards = {shards[key] for key, owner in replicas.items() if owner == replica_index}
+        assert replica_shards == {0, 1, 2, 3}
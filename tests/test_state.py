@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# pylint: disable=line-too-long, missing-function-docstring, logging-fstring-interpolation
+# pylint: disable=import-error,wrong-import-position
+"""
+
+  State file tests
+  The state is read back as it was saved, plain or gzipped, and a state file which can't be used
+  is ignored instead of stopping the exporter.
+
+"""
+
+import os
+import sys
+import gzip
+import json
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "airquality"))
+
+import pytest
+
+from state import StateStore
+from providers.iqair.quota import Quota
+
+
+SOURCES = {
+    "main": {
+        "quota": {"key": {"minute": [3, 60060], "day": [120, 86400], "month": [1200, 2592000]}},
+        "readings": {"Serbia|Central Serbia|Belgrade": {"pollution_ts": 1738911600, "aqius": 77}},
+    },
+}
+
+
+@pytest.mark.parametrize("filename", ["state.json", "state.json.gz"])
+def test_saved_state_is_loaded_back(tmp_path, filename):
+    state_store = StateStore(str(tmp_path / filename))
+
+    assert state_store.save(SOURCES, shutdown={"duration": 1.5, "in_time": True})
+
+    state = state_store.load()
+    assert state["sources"] == SOURCES
+    assert state["shutdown"] == {"duration": 1.5, "in_time": True}
+    assert os.listdir(tmp_path) == [filename]
+
+
+def test_gzipped_state_is_compressed(tmp_path):
+    state_store = StateStore(str(tmp_path / "state.json.gz"))
+    state_store.save(SOURCES)
+
+    with gzip.open(tmp_path / "state.json.gz", "rb") as state_fh:
+        assert json.loads(state_fh.read())["sources"] == SOURCES
+
+
+def test_missing_state_file_is_empty(tmp_path):
+    assert not StateStore(str(tmp_path / "state.json")).load()
+
+
+@pytest.mark.parametrize("content", [b"{\"version\": 0, \"sources\": {}}", b"{\"version\": 1, \"sour"])
+def test_unusable_state_file_is_ignored(tmp_path, content):
+    (tmp_path / "state.json").write_bytes(content)
+
+    assert not StateStore(str(tmp_path / "state.json")).load()
+
+
+def test_quota_counters_survive_a_restart(tmp_path):
+    state_store = StateStore(str(tmp_path / "state.json"))
+    now = 60 * 1000 + 10
+
+    quota = Quota("test-key-state", 5, 500, 10000)
+    quota.acquire(now=now)
+    quota.acquire(now=now)
+    state_store.save({"main": {"quota": quota.dump()}})
+
+    restored_quota = Quota("test-key-state", 5, 500, 10000)
+    restored_quota.restore(state_store.load()["sources"]["main"]["quota"], now=now + 5)
+    assert restored_quota.snapshot(now=now + 5)["minute"]["count"] == 2
+
+    expired_quota = Quota("test-key-state", 5, 500, 10000)
+    expired_quota.restore(state_store.load()["sources"]["main"]["quota"], now=now + 60)
+    assert expired_quota.snapshot(now=now + 60)["minute"]["count"] == 0
+    assert expired_quota.snapshot(now=now + 60)["day"]["count"] == 2